@@ -0,0 +1,254 @@
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from functools import wraps
+
+from flask import jsonify
+from flask_login import current_user
+
+# --- ADMISSION CONTROL ---
+# OCR and LLM calls hold a worker thread for seconds. Each expensive endpoint gets a
+# bounded pool (max in-flight + max waiting) and a per-user token bucket, so a burst
+# is turned away with 429 + Retry-After instead of starving the cheap CRUD endpoints.
+# State is per worker process: with gunicorn run gthread workers (see gunicorn.conf.py).
+
+class TokenBucket:
+    """ Per-key token bucket: `rate` tokens per second, holding at most `burst`. """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """ Returns (allowed, retry_after_seconds). """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                allowed, retry_after = True, 0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (1 - tokens) / self.rate
+            if len(self._buckets) > 10000:
+                self._prune(now)
+        return allowed, retry_after
+
+    def _prune(self, now):
+        # A bucket idle long enough to refill completely carries no state
+        full_after = self.burst / self.rate
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < full_after}
+
+class AdmissionPool:
+    """
+    Bounded concurrency for one endpoint: up to `max_concurrent` requests run, up to
+    `max_queue` wait (for at most `queue_timeout` seconds), everything else is rejected.
+    """
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout=30.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        # Smoothed service time, used to suggest a Retry-After
+        self._avg_service = 1.0
+        self.stats = {
+            "admitted": 0,
+            "queued_total": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "rejected_rate_limit": 0,
+            "completed": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def retry_after(self):
+        """ Rough time until a slot frees up for a newcomer at the back of the queue. """
+        waves = (self.queued + 1) / float(self.max_concurrent)
+        return max(1, math.ceil(waves * self._avg_service))
+
+    def acquire(self):
+        """ Returns (admitted, retry_after_seconds). """
+        with self._cond:
+            if self.in_flight < self.max_concurrent and self.queued == 0:
+                self.in_flight += 1
+                self.stats["admitted"] += 1
+                return True, 0
+            if self.queued >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                return False, self.retry_after()
+
+            self.queued += 1
+            self.stats["queued_total"] += 1
+            start = time.monotonic()
+            deadline = start + self.queue_timeout
+            try:
+                while self.in_flight >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["rejected_timeout"] += 1
+                        return False, self.retry_after()
+                    self._cond.wait(remaining)
+            finally:
+                self.queued -= 1
+
+            waited = time.monotonic() - start
+            self.stats["wait_seconds_total"] += waited
+            self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return True, 0
+
+    def release(self, service_seconds):
+        with self._cond:
+            self.in_flight -= 1
+            self.stats["completed"] += 1
+            self._avg_service = 0.8 * self._avg_service + 0.2 * service_seconds
+            self._cond.notify()
+
+    def record_rate_limited(self):
+        with self._cond:
+            self.stats["rejected_rate_limit"] += 1
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, name=self.name, in_flight=self.in_flight, queued=self.queued,
+                        max_concurrent=self.max_concurrent, max_queue=self.max_queue,
+                        avg_service_seconds=round(self._avg_service, 3))
+
+class AsyncAdmissionPool(AdmissionPool):
+    """
+    Same limits and metrics as AdmissionPool for asyncio code: waiting requests park
+    on a future instead of a thread, and a finished request hands its slot straight
+    to the oldest waiter.
+    """
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout=30.0):
+        super().__init__(name, max_concurrent, max_queue, queue_timeout)
+        self._waiters = deque()
+
+    async def acquire_async(self):
+        """ Returns (admitted, retry_after_seconds). """
+        with self._cond:
+            if self.in_flight < self.max_concurrent and not self._waiters:
+                self.in_flight += 1
+                self.stats["admitted"] += 1
+                return True, 0
+            if self.queued >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                return False, self.retry_after()
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self.queued += 1
+            self.stats["queued_total"] += 1
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Client went away while queued: give back a slot we may have been handed
+            with self._cond:
+                self.queued -= 1
+                handed_over = waiter.done() and not waiter.cancelled()
+                if not handed_over:
+                    waiter.cancel()
+                    self._waiters.remove(waiter)
+            if handed_over:
+                self._hand_over()
+            raise
+        with self._cond:
+            self.queued -= 1
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                self.stats["rejected_timeout"] += 1
+                return False, self.retry_after()
+            # The slot was handed over by release_async (in_flight already counts it)
+            waited = time.monotonic() - start
+            self.stats["wait_seconds_total"] += waited
+            self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+            self.stats["admitted"] += 1
+            return True, 0
+
+    def release_async(self, service_seconds):
+        with self._cond:
+            self.stats["completed"] += 1
+            self._avg_service = 0.8 * self._avg_service + 0.2 * service_seconds
+        self._hand_over()
+
+    def _hand_over(self):
+        with self._cond:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(True)
+                    return
+            self.in_flight -= 1
+
+# --- THREAD BUDGET ---
+# Under gthread every admitted *and* every queued request occupies a worker thread, so
+# the pools' (max_concurrent + max_queue) must fit in the threads not kept for CRUD.
+
+def split_thread_budget(threads, reserved, weights):
+    """
+    Splits threads - reserved across pools by weight; returns [(max_concurrent, max_queue), ...].
+    Every pool gets at least one running and one waiting slot when the budget allows it,
+    so a second request queues instead of being turned away.
+    """
+    budget = threads - reserved
+    if budget < len(weights):
+        raise RuntimeError(f"{threads} worker threads leave no room for {len(weights)} admission pools "
+                           f"after reserving {reserved} for CRUD; raise GUNICORN_THREADS")
+    floor = 2 if budget >= 2 * len(weights) else 1
+    extra = budget - floor * len(weights)
+    totals = [floor + extra * w // sum(weights) for w in weights]
+    totals[weights.index(max(weights))] += budget - sum(totals)
+    # Half of each share runs (rounded up), the rest waits
+    return [((t + 1) // 2, t // 2) for t in totals]
+
+def check_thread_budget(pools, threads, reserved):
+    """ Fails at startup when explicit pool settings could park every CRUD thread. """
+    used = sum(p.max_concurrent + p.max_queue for p in pools)
+    if used > threads - reserved:
+        detail = ", ".join(f"{p.name} {p.max_concurrent}+{p.max_queue}" for p in pools)
+        raise RuntimeError(f"Admission pools can hold {used} threads ({detail}) but only {threads - reserved} "
+                           f"of {threads} are available with {reserved} reserved for CRUD")
+
+def too_busy(message, retry_after):
+    response = jsonify({"error": message, "retry_after": retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def admit(pool, bucket=None):
+    """
+    View decorator: applies the user's token bucket, then waits for a slot in `pool`.
+    Goes below @login_required so current_user is set.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if bucket is not None:
+                allowed, wait = bucket.take(current_user.id)
+                if not allowed:
+                    pool.record_rate_limited()
+                    return too_busy("Rate limit exceeded, slow down.", max(1, math.ceil(wait)))
+
+            admitted, retry_after = pool.acquire()
+            if not admitted:
+                return too_busy("Server busy, try again shortly.", retry_after)
+            start = time.monotonic()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                pool.release(time.monotonic() - start)
+        return wrapper
+    return decorator
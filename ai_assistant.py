@@ -3,24 +3,27 @@ import json
 from groq import Groq
 from dotenv import load_dotenv
 
+import fx
+
 load_dotenv()
 
 # Initialize Groq Client
 api_key = os.getenv("GROQ_API_KEY")
 client = Groq(api_key=api_key) if api_key else None
 
-def get_ai_insight(user_query, expense_summary):
-    """
-    Chatbot Logic: Answers questions based on financial data + User Profile.
-    """
-    if not client:
-        return "⚠️ API Key missing. Please set GROQ_API_KEY in .env file."
+CHAT_MODEL = "llama-3.3-70b-versatile"
+RECEIPT_MODEL = "llama-3.1-8b-instant"
+MISSING_KEY_MESSAGE = "⚠️ API Key missing. Please set GROQ_API_KEY in .env file."
 
+def build_insight_prompt(user_query, expense_summary):
+    """ Personalized FinBot prompt (shared with ai_assistant_async). """
     # Extract Profile Context
     profile = expense_summary.get('user_profile', {})
     role = profile.get('role', 'User')
     name = profile.get('full_name', 'Friend')
     occupation = profile.get('occupation', 'General')
+    currency = expense_summary.get('base_currency', fx.BASE_CURRENCY)
+    symbol = fx.currency_symbol(currency).strip()
 
     # Personalized System Prompt
     system_prompt = f"""
@@ -41,26 +44,30 @@ def get_ai_insight(user_query, expense_summary):
 
     Rules:
     - Be concise, friendly, and use emojis.
-    - Use Indian Rupees (₹) for currency.
+    - Use {currency} ({symbol}) for currency.
+    - Add up base_amount (already in base_currency), never amount: amount is in the transaction's own currency.
     - Answer ONLY based on data provided.
     """
+    return system_prompt
+
+def get_ai_insight(user_query, expense_summary):
+    """
+    Chatbot Logic: Answers questions based on financial data + User Profile.
+    """
+    if not client:
+        return MISSING_KEY_MESSAGE
 
     try:
         response = client.chat.completions.create(
-            messages=[{"role": "user", "content": system_prompt}],
-            model="llama-3.3-70b-versatile", 
+            messages=[{"role": "user", "content": build_insight_prompt(user_query, expense_summary)}],
+            model=CHAT_MODEL, 
         )
         return response.choices[0].message.content
     except Exception as e:
         return f"AI Error: {str(e)}"
 
-def clean_receipt_with_ai(raw_text):
-    """
-    OCR Cleanup: Extracts structured data with Indian context.
-    """
-    if not client:
-        return None 
-
+def build_receipt_prompt(raw_text):
+    """ Receipt extraction prompt (shared with ai_assistant_async). """
     prompt = f"""
     Analyze this receipt text and extract JSON.
     Text: "{raw_text}"
@@ -74,15 +81,24 @@ def clean_receipt_with_ai(raw_text):
        - If multiple dates exist, pick the transaction date.
     3. amount: Total numeric value (ignore currency symbols like ₹, Rs, $).
     4. category: Choose best match from [Food, Travel, Shopping, Utilities, Medical, Salary, Other].
+    5. currency: ISO 4217 code of the amount (₹/Rs -> INR, $ -> USD, € -> EUR). Use null if unclear.
     
-    Return ONLY valid JSON. Keys: merchant, date, amount, category.
+    Return ONLY valid JSON. Keys: merchant, date, amount, category, currency.
     If a field is not found, use null.
     """
+    return prompt
+
+def clean_receipt_with_ai(raw_text):
+    """
+    OCR Cleanup: Extracts structured data with Indian context.
+    """
+    if not client:
+        return None 
 
     try:
         response = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama-3.1-8b-instant", 
+            messages=[{"role": "user", "content": build_receipt_prompt(raw_text)}],
+            model=RECEIPT_MODEL, 
             response_format={"type": "json_object"}
         )
         return json.loads(response.choices[0].message.content)
@@ -0,0 +1,56 @@
+import os
+import json
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+
+from ai_assistant import (build_insight_prompt, build_receipt_prompt,
+                          CHAT_MODEL, RECEIPT_MODEL, MISSING_KEY_MESSAGE)
+
+load_dotenv()
+
+# Async twin of ai_assistant: same prompts and models, but the HTTP round trip is
+# awaited, so one event loop can keep hundreds of LLM calls in flight (see asgi.py).
+
+# The SDK default caps a client at 100 connections, which would cap in-flight calls too
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "256"))
+
+api_key = os.getenv("GROQ_API_KEY")
+client = AsyncGroq(
+    api_key=api_key,
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)),
+) if api_key else None
+
+async def get_ai_insight(user_query, expense_summary):
+    """
+    Chatbot Logic: Answers questions based on financial data + User Profile.
+    """
+    if not client:
+        return MISSING_KEY_MESSAGE
+
+    try:
+        response = await client.chat.completions.create(
+            messages=[{"role": "user", "content": build_insight_prompt(user_query, expense_summary)}],
+            model=CHAT_MODEL,
+        )
+        return response.choices[0].message.content
+    except Exception as e:
+        return f"AI Error: {str(e)}"
+
+async def clean_receipt_with_ai(raw_text):
+    """
+    OCR Cleanup: Extracts structured data with Indian context.
+    """
+    if not client:
+        return None
+
+    try:
+        response = await client.chat.completions.create(
+            messages=[{"role": "user", "content": build_receipt_prompt(raw_text)}],
+            model=RECEIPT_MODEL,
+            response_format={"type": "json_object"}
+        )
+        return json.loads(response.choices[0].message.content)
+    except:
+        return None
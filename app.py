@@ -1,26 +1,70 @@
 import os
-import pandas as pd
+import math
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 from datetime import date
 
-from database import get_db_connection, init_db
+from database import get_db_connection, init_db, assign_shard
 from models import User
-from ocr_engine import extract_text, get_image_hash, check_duplicate_image
-from ai_assistant import get_ai_insight, clean_receipt_with_ai
+from admission import AdmissionPool, TokenBucket, admit, split_thread_budget, check_thread_budget
+from flagging import flag_expense
+from forecast import forecast_budgets, is_budget_question, answer_budget_question
+import storage
+import fx
+import payloads
+
+# NOTE: pandas, ocr_engine (cv2/numpy/pytesseract/imagehash) and ai_assistant (groq)
+# are imported lazily inside the routes that need them, so workers that only serve
+# CRUD JSON don't pay their import time and memory.
 
 load_dotenv()
 
+HEAVY_MODULES = ('pandas', 'ocr_engine', 'ai_assistant')
+
+def preload_heavy_modules():
+    """
+    Imports every heavy dependency up front. Used with gunicorn's preload_app so the
+    master loads them once and forked workers share the pages copy-on-write.
+    """
+    import importlib
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+if os.environ.get('PRELOAD_HEAVY_MODULES') == '1':
+    preload_heavy_modules()
+
 app = Flask(__name__)
 # Use the environment variable if available, otherwise fallback to dev key
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Content-addressed images never change, so browsers may cache them for a year
+MEDIA_CACHE_SECONDS = 365 * 24 * 3600
+
+# Idempotent: creates missing tables/columns on startup
+init_db()
+
+# --- ADMISSION CONTROL (per worker process) ---
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+# Same variable gunicorn.conf.py reads. Defaults: 8 threads -> 3 kept for CRUD,
+# upload 1 running + 1 waiting, chat 2 running + 1 waiting
+WORKER_THREADS = env_int('GUNICORN_THREADS', 8)
+CRUD_THREADS = env_int('CRUD_RESERVED_THREADS', max(2, WORKER_THREADS * 3 // 8))
+(upload_run, upload_wait), (chat_run, chat_wait) = split_thread_budget(WORKER_THREADS, CRUD_THREADS, (1, 2))
+
+upload_pool = AdmissionPool('upload', max_concurrent=env_int('UPLOAD_CONCURRENCY', upload_run),
+                            max_queue=env_int('UPLOAD_QUEUE', upload_wait))
+chat_pool = AdmissionPool('chat', max_concurrent=env_int('CHAT_CONCURRENCY', chat_run),
+                          max_queue=env_int('CHAT_QUEUE', chat_wait))
+# Tokens per second / burst per user
+upload_bucket = TokenBucket(rate=env_int('UPLOAD_RATE_PER_MIN', 10) / 60.0, burst=env_int('UPLOAD_BURST', 5))
+chat_bucket = TokenBucket(rate=env_int('CHAT_RATE_PER_MIN', 20) / 60.0, burst=env_int('CHAT_BURST', 5))
+ADMISSION_POOLS = (upload_pool, chat_pool)
+check_thread_budget(ADMISSION_POOLS, WORKER_THREADS, CRUD_THREADS)
 
 # Setup Login Manager
 login_manager = LoginManager()
@@ -53,10 +97,11 @@ def register():
         else:
             hashed_pw = generate_password_hash(password, method='scrypt')
             # Insert with new profile fields
-            conn.execute('''INSERT INTO users 
+            cur = conn.execute('''INSERT INTO users 
                          (username, email, password_hash, full_name, age, occupation, role) 
                          VALUES (?, ?, ?, ?, ?, ?, ?)''',
                          (username, email, hashed_pw, full_name, age, occupation, role))
+            assign_shard(conn, cur.lastrowid)
             conn.commit()
             flash('Registration successful! Please login.')
             return redirect(url_for('login'))
@@ -103,7 +148,9 @@ def logout():
 @app.route('/')
 @login_required
 def dashboard():
-    return render_template('dashboard.html', user=current_user)
+    return render_template('dashboard.html', user=current_user,
+                           currencies=fx.currencies(), base_currency=fx.BASE_CURRENCY,
+                           base_symbol=fx.currency_symbol())
 
 @app.route('/api/profile', methods=['PUT'])
 @login_required
@@ -116,6 +163,25 @@ def update_profile():
     conn.close()
     return jsonify({"message": "Profile updated"}), 200
 
+def expense_money(data, fallback_currency=None):
+    """
+    Validated (amount, currency) of an expense body. An omitted currency falls back to
+    `fallback_currency` (the row's current one on edits), then BASE_CURRENCY.
+    Raises ValueError with a message for the 400 response.
+    """
+    currency = data.get('currency')
+    if currency:
+        if not isinstance(currency, str) or fx.normalize_currency(currency) not in fx.currencies():
+            raise ValueError(f"Unsupported currency: {currency}")
+    currency = fx.normalize_currency(currency or fallback_currency)
+    try:
+        amount = float(data['amount'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Amount must be a number")
+    if not math.isfinite(amount):
+        raise ValueError("Amount must be a number")
+    return amount, currency
+
 @app.route('/api/expenses', methods=['GET', 'POST'])
 @login_required
 def handle_expenses():
@@ -123,24 +189,34 @@ def handle_expenses():
     
     if request.method == 'POST':
         data = request.json
+        try:
+            amount, currency = expense_money(data)
+        except ValueError as e:
+            conn.close()
+            return jsonify({"error": str(e)}), 400
         c = conn.cursor()
         
-        c.execute('''INSERT INTO expenses (user_id, date, merchant, amount, currency, category, type, payment_mode, notes, source, is_flagged, flag_reason)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        c.execute('''INSERT INTO expenses (user_id, date, merchant, amount, currency, base_amount, category, type, payment_mode, notes, source, image_hash, image_key, is_flagged, flag_reason)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                   (current_user.id, 
                    data['date'], 
                    data['merchant'], 
-                   data['amount'], 
-                   data.get('currency', 'INR'), 
+                   amount, 
+                   currency, 
+                   fx.to_base(amount, currency, data['date']),
                    data['category'], 
                    data['type'], 
                    data.get('payment_mode', 'Cash'),
                    data.get('notes', ''),
                    data.get('source', 'manual'), 
+                   data.get('image_hash'),
+                   data.get('image_key'),
                    data.get('is_flagged', 0), 
                    data.get('flag_reason')))
         
         conn.commit()
+        # Duplicate / spending-spike check for the new row
+        flag_expense(conn, current_user.id, c.lastrowid)
         conn.close()
         return jsonify({"message": "Saved"}), 201
 
@@ -166,9 +242,8 @@ def handle_expenses():
 
     query += " ORDER BY date DESC"
 
-    expenses = conn.execute(query, params).fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in expenses])
+    # Streamed and compressed; ?format=columnar for the compact encoding (see payloads.py)
+    return payloads.query_response(conn, conn.execute(query, params), request)
 
 # --- EDIT & DELETE ROUTE ---
 @app.route('/api/expenses/<int:id>', methods=['PUT', 'DELETE'])
@@ -184,26 +259,55 @@ def modify_expense(id):
 
     if request.method == 'PUT':
         data = request.json
+        row = conn.execute('SELECT currency FROM expenses WHERE id=? AND user_id=?', (id, current_user.id)).fetchone()
+        try:
+            amount, currency = expense_money(data, row['currency'] if row else None)
+        except ValueError as e:
+            conn.close()
+            return jsonify({"error": str(e)}), 400
         conn.execute('''UPDATE expenses 
-                     SET date=?, merchant=?, amount=?, category=?, type=?, payment_mode=?
+                     SET date=?, merchant=?, amount=?, currency=?, base_amount=?, category=?, type=?, payment_mode=?
                      WHERE id=? AND user_id=?''',
-                  (data['date'], data['merchant'], data['amount'], data['category'], 
+                  (data['date'], data['merchant'], amount, currency,
+                   fx.to_base(amount, currency, data['date']), data['category'], 
                    data['type'], data.get('payment_mode', 'Cash'), id, current_user.id))
         conn.commit()
+        flag_expense(conn, current_user.id, id)
         conn.close()
         return jsonify({"message": "Updated"}), 200
 
 # --- SCANNER ROUTE ---
+def apply_receipt_defaults(ai_data):
+    """ --- ROBUST DEFAULTS --- for whatever the LLM could (not) extract. """
+    if not ai_data:
+        ai_data = {}
+
+    if not ai_data.get('date'):
+        ai_data['date'] = date.today().strftime('%Y-%m-%d')
+        
+    if not ai_data.get('merchant'): ai_data['merchant'] = "Unknown Merchant"
+    if not ai_data.get('amount'): ai_data['amount'] = 0
+    if not ai_data.get('category'): ai_data['category'] = "Other"
+    ai_data['currency'] = fx.normalize_currency(ai_data.get('currency'))
+    return ai_data
+
 @app.route('/api/upload', methods=['POST'])
 @login_required
+@admit(upload_pool, upload_bucket)
 def upload_bill():
+    from ocr_engine import extract_text, get_image_hash, check_duplicate_image
+    from ai_assistant import clean_receipt_with_ai
+
     if 'file' not in request.files: return jsonify({"error": "No file"}), 400
     file = request.files['file']
     if file.filename == '': return jsonify({"error": "No file"}), 400
 
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    # Stored once per unique image; same-named photos from different users no longer collide
+    try:
+        image_key = storage.store_upload(file, current_user.id)
+    except storage.UnsupportedImage as e:
+        return jsonify({"error": str(e)}), 400
+    filepath = storage.object_path(image_key)
 
     try:
         # 1. Check for duplicates
@@ -215,59 +319,94 @@ def upload_bill():
 
         # 2. Run OCR & AI Analysis
         raw_text = extract_text(filepath)
-        ai_data = clean_receipt_with_ai(raw_text) 
-        
-        # --- ROBUST DEFAULTS ---
-        if not ai_data:
-            ai_data = {}
-
-        if not ai_data.get('date'):
-            ai_data['date'] = date.today().strftime('%Y-%m-%d')
-            
-        if not ai_data.get('merchant'): ai_data['merchant'] = "Unknown Merchant"
-        if not ai_data.get('amount'): ai_data['amount'] = 0
-        if not ai_data.get('category'): ai_data['category'] = "Other"
+        ai_data = apply_receipt_defaults(clean_receipt_with_ai(raw_text))
 
         response = ai_data
         response['is_flagged'] = 1 if is_dup else 0
         response['flag_reason'] = f"Duplicate of ID {orig_id}" if is_dup else None
         response['image_hash'] = img_hash
-        response['image_url'] = f"/static/uploads/{filename}"
+        response['image_key'] = image_key
+        response['image_url'] = url_for('serve_media', digest=image_key, variant='preview')
+        response['thumb_url'] = url_for('serve_media', digest=image_key, variant='thumb')
         
         return jsonify(response), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+# --- RECEIPT IMAGES ---
+@app.route('/media/<digest>', defaults={'variant': 'original'})
+@app.route('/media/<digest>/<variant>')
+@login_required
+def serve_media(digest, variant):
+    if not storage.is_valid_digest(digest) or not storage.user_has_image(current_user.id, digest):
+        return jsonify({"error": "Not found"}), 404
+    found = storage.resolve(digest, variant)
+    if not found:
+        return jsonify({"error": "Not found"}), 404
+
+    path, mime = found
+    # conditional=True gives ETag/If-None-Match and Range (206) support. Absolute path:
+    # send_file resolves relative ones against app.root_path, MEDIA_FOLDER is cwd-relative
+    response = send_file(os.path.abspath(path), mimetype=mime, conditional=True, etag=f"{digest}-{variant}")
+    response.headers['Cache-Control'] = f'private, max-age={MEDIA_CACHE_SECONDS}, immutable'
+    # Served as the sniffed image type only; browsers must not guess (e.g. HTML)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
 @app.route('/api/chat', methods=['POST'])
 @login_required
+@admit(chat_pool, chat_bucket)
 def chat():
+    from ai_assistant import get_ai_insight
+
     data = request.json
-    conn = get_db_connection()
+    summary = build_chat_summary(current_user.id)
+    # Budget-pace questions are answered from the local forecast, no LLM round trip
+    if is_budget_question(data.get('message'), [f['category'] for f in summary['budget_forecast']]):
+        return jsonify({"response": answer_budget_question(summary['budget_forecast'])})
+    return jsonify({"response": get_ai_insight(data.get('message'), summary)})
+
+def build_chat_summary(user_id):
+    """ Financial context sent to FinBot (shared with the async chat in asgi.py). """
+    conn = get_db_connection(user_id)
     
     # 1. Get User Profile
-    user_info = conn.execute('SELECT full_name, role, occupation FROM users WHERE id=?', (current_user.id,)).fetchone()
+    user_info = conn.execute('SELECT full_name, role, occupation FROM users WHERE id=?', (user_id,)).fetchone()
     
     # 2. Fetch expenses
-    expenses = conn.execute('SELECT category, amount, date, merchant, type FROM expenses WHERE user_id = ?', (current_user.id,)).fetchall()
+    expenses = conn.execute('''SELECT category, amount, currency, COALESCE(base_amount, amount) AS base_amount, date, merchant, type
+                               FROM expenses WHERE user_id = ?''', (user_id,)).fetchall()
     
     # 3. Fetch Budgets (FIXED: using 'amount' column)
-    budgets = conn.execute('SELECT category, amount FROM budgets WHERE user_id=?', (current_user.id,)).fetchall()
+    budgets = conn.execute('SELECT category, amount FROM budgets WHERE user_id=?', (user_id,)).fetchall()
     budget_map = {b['category']: b['amount'] for b in budgets}
+
+    # 4. Budget pace forecasts
+    forecasts = [f for f in forecast_budgets(conn, user_id) if f['active']]
+    for f in forecasts:
+        del f['id'], f['user_id']
     
     conn.close()
     
-    summary = {
+    return {
         "user_profile": dict(user_info) if user_info else {},
+        "base_currency": fx.BASE_CURRENCY,
         "total_transactions": len(expenses),
         "recent_transactions": [dict(row) for row in expenses[:5]],
-        "category_budgets": budget_map
+        "category_budgets": budget_map,
+        "budget_forecast": forecasts
     }
-    
-    return jsonify({"response": get_ai_insight(data.get('message'), summary)})
+
+@app.route('/api/metrics/admission', methods=['GET'])
+@login_required
+def admission_metrics():
+    return jsonify({"pid": os.getpid(), "pools": [p.snapshot() for p in ADMISSION_POOLS]})
 
 @app.route('/api/export', methods=['GET'])
 @login_required
 def export_excel():
+    import pandas as pd
+
     conn = get_db_connection()
     df = pd.read_sql_query("SELECT * FROM expenses WHERE user_id = ?", conn, params=(current_user.id,))
     conn.close()
@@ -292,28 +431,10 @@ def handle_budgets():
         conn.close()
         return jsonify({"message": "Budget saved"}), 200
 
-    # 2. GET BUDGETS & CALCULATE PROGRESS
-    budgets = conn.execute('SELECT * FROM budgets WHERE user_id=? ORDER BY end_date DESC', 
-                           (current_user.id,)).fetchall()
-    
-    budget_status = []
-    for b in budgets:
-        # Sum expenses ONLY within the budget's specific date range
-        spent = conn.execute('''
-            SELECT SUM(amount) FROM expenses 
-            WHERE user_id=? AND category=? AND type='Debit' 
-            AND date >= ? AND date <= ?
-        ''', (current_user.id, b['category'], b['start_date'], b['end_date'])).fetchone()[0] or 0
-        
-        budget_status.append({
-            "id": b['id'],
-            "category": b['category'],
-            "limit": b['amount'],
-            "start_date": b['start_date'],
-            "end_date": b['end_date'],
-            "spent": spent,
-            "percentage": min(100, (spent / b['amount']) * 100) if b['amount'] > 0 else 0
-        })
+    # 2. GET BUDGETS, PROGRESS & FORECAST (single grouped query for all budgets)
+    budget_status = forecast_budgets(conn, current_user.id)
+    for b in budget_status:
+        del b['user_id']
     
     conn.close()
     return jsonify(budget_status)
@@ -337,5 +458,4 @@ def modify_budget(id):
     return jsonify({"message": "Success"}), 200
 
 if __name__ == '__main__':
-    init_db()
     app.run(debug=True)
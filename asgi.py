@@ -0,0 +1,152 @@
+import json
+import time
+import asyncio
+from http.cookies import SimpleCookie
+
+from itsdangerous import BadSignature
+
+from app import app as flask_app, build_chat_summary, apply_receipt_defaults, chat_bucket, env_int
+from admission import AsyncAdmissionPool, TokenBucket
+from forecast import is_budget_question, answer_budget_question
+from models import User
+import ai_assistant_async
+
+# --- ASYNC LLM SUB-APP ---
+# A small ASGI app for the endpoints that mostly wait on the LLM. One event loop keeps
+# hundreds of Groq calls in flight, where a sync Flask worker thread would sit idle
+# for each round trip. Everything else stays on the Flask app.
+#
+# Run next to gunicorn and route these paths to it from the reverse proxy:
+#   uvicorn asgi:application --port 8001
+#   POST /api/chat             -> same request/response as the Flask route
+#   POST /api/receipt/clean    -> {"text": "<raw OCR text>"} -> cleaned receipt fields
+#   GET  /api/metrics/admission
+# It reads the Flask session cookie, so users stay logged in across both.
+
+MAX_BODY = 1024 * 1024
+
+QUEUE_TIMEOUT = env_int('ASYNC_QUEUE_TIMEOUT', 30)
+
+chat_pool = AsyncAdmissionPool('chat_async', max_concurrent=env_int('ASYNC_CHAT_CONCURRENCY', 256),
+                               max_queue=env_int('ASYNC_CHAT_QUEUE', 512), queue_timeout=QUEUE_TIMEOUT)
+clean_pool = AsyncAdmissionPool('clean_async', max_concurrent=env_int('ASYNC_CLEAN_CONCURRENCY', 256),
+                                max_queue=env_int('ASYNC_CLEAN_QUEUE', 512), queue_timeout=QUEUE_TIMEOUT)
+# Token buckets live in process memory, so limits are per process: uvicorn and each
+# gunicorn worker keep their own chat allowance for a user (same as between gunicorn
+# workers). Receipt cleaning is one call per scanned bill, so it gets its own
+# (upload-sized) bucket instead of eating the chat budget
+clean_bucket = TokenBucket(rate=env_int('CLEAN_RATE_PER_MIN', 10) / 60.0, burst=env_int('CLEAN_BURST', 5))
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+def session_user_id(headers):
+    """ Decodes Flask's signed session cookie and returns Flask-Login's user id. """
+    cookie = SimpleCookie(headers.get('cookie', ''))
+    morsel = cookie.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not morsel:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        data = serializer.loads(morsel.value,
+                                max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return data.get('_user_id')
+
+async def read_json(receive):
+    body = b''
+    more = True
+    while more:
+        message = await receive()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+        if len(body) > MAX_BODY:
+            raise HTTPError(413, "Request too large")
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON")
+    if not isinstance(data, dict):
+        raise HTTPError(400, "Expected a JSON object")
+    return data
+
+async def send_json(send, status, payload, headers=None):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())] + (headers or []),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def admitted(pool, bucket, user_id, handler):
+    """ Token bucket + async admission pool around one LLM-bound handler. """
+    allowed, wait = bucket.take(user_id)
+    if not allowed:
+        pool.record_rate_limited()
+        retry = max(1, int(wait + 0.999))
+        raise HTTPError(429, "Rate limit exceeded, slow down.", [(b'retry-after', str(retry).encode())])
+    ok, retry = await pool.acquire_async()
+    if not ok:
+        raise HTTPError(429, "Server busy, try again shortly.", [(b'retry-after', str(retry).encode())])
+    start = time.monotonic()
+    try:
+        return await handler()
+    finally:
+        pool.release_async(time.monotonic() - start)
+
+async def chat(user_id, data):
+    summary = await asyncio.to_thread(build_chat_summary, user_id)
+    if is_budget_question(data.get('message'), [f['category'] for f in summary['budget_forecast']]):
+        return {"response": answer_budget_question(summary['budget_forecast'])}
+    reply = await ai_assistant_async.get_ai_insight(data.get('message'), summary)
+    return {"response": reply}
+
+async def clean_receipt(user_id, data):
+    return apply_receipt_defaults(await ai_assistant_async.clean_receipt_with_ai(data.get('text', '')))
+
+ROUTES = {
+    ('POST', '/api/chat'): (chat_pool, chat_bucket, chat),
+    ('POST', '/api/receipt/clean'): (clean_pool, clean_bucket, clean_receipt),
+}
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+    try:
+        user_id = session_user_id(headers)
+        if user_id is None or await asyncio.to_thread(User.get, user_id) is None:
+            raise HTTPError(401, "Login required")
+
+        if (scope['method'], scope['path']) == ('GET', '/api/metrics/admission'):
+            await send_json(send, 200, {"pools": [chat_pool.snapshot(), clean_pool.snapshot()]})
+            return
+
+        route = ROUTES.get((scope['method'], scope['path']))
+        if route is None:
+            raise HTTPError(404, "Not found")
+        pool, bucket, handler = route
+        data = await read_json(receive)
+        payload = await admitted(pool, bucket, user_id, lambda: handler(user_id, data))
+        await send_json(send, 200, payload)
+    except HTTPError as e:
+        body = {"error": e.message}
+        if e.status == 429:
+            body["retry_after"] = int(dict(e.headers)[b'retry-after'])
+        await send_json(send, e.status, body, e.headers)
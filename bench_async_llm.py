@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+
+# Load test for the LLM-bound chat endpoint: the sync Flask route (one worker, N threads)
+# vs the async sub-app in asgi.py (one event loop), both talking to a local fake
+# Groq server that answers after an artificial delay.
+#
+# Usage: python bench_async_llm.py [requests] [latency_seconds] [sync_threads]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Must reach the LLM: budget-pace questions are answered locally (forecast.is_budget_question)
+CHAT_PROMPT = "Give me one tip to spend less on food."
+
+class FakeLLM:
+    """ Minimal OpenAI-style /chat/completions server with a fixed response delay. """
+    def __init__(self, latency):
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+        self.served = 0
+        self.port = None
+        self._ready = threading.Event()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    if line.lower().startswith(b'content-length:'):
+                        length = int(line.split(b':', 1)[1])
+                request = json.loads(await reader.readexactly(length) or b'{}')
+
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+                await asyncio.sleep(self.latency)
+                self.in_flight -= 1
+                self.served += 1
+
+                content = "You're on track 👍"
+                if request.get('response_format', {}).get('type') == 'json_object':
+                    content = json.dumps({"merchant": "Fake Mart", "date": "2025-01-15",
+                                          "amount": 120.5, "category": "Food"})
+                body = json.dumps({
+                    "id": "fake", "object": "chat.completion", "created": int(time.time()),
+                    "model": request.get('model', 'fake'),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self):
+        def run():
+            loop = asyncio.new_event_loop()
+            server = loop.run_until_complete(asyncio.start_server(self.handle, '127.0.0.1', 0, backlog=4096))
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            loop.run_forever()
+        threading.Thread(target=run, daemon=True).start()
+        self._ready.wait()
+
+    def reset(self):
+        self.peak = 0
+        self.served = 0
+
+def setup_app(llm_port, tmpdir):
+    """ Imports the app against a throwaway DB and fake LLM, returns a session cookie. """
+    os.environ['GROQ_API_KEY'] = 'fake-key'
+    os.environ['GROQ_BASE_URL'] = f'http://127.0.0.1:{llm_port}'
+    # Rate limits and pool sizes out of the way: we measure raw concurrency here
+    os.environ.setdefault('CHAT_RATE_PER_MIN', '100000000')
+    os.environ.setdefault('CHAT_BURST', '100000000')
+    os.environ.setdefault('CHAT_CONCURRENCY', '1024')
+    os.environ.setdefault('CHAT_QUEUE', '100000')
+    os.environ.setdefault('CLEAN_RATE_PER_MIN', '100000000')
+    os.environ.setdefault('CLEAN_BURST', '100000000')
+    # Async routes: together no more in flight than the LLM client has connections
+    # (beyond that httpcore queues requests itself, scanning its queue per request, so a
+    # large `total` turns CPU-bound); the rest waits in the admission queues
+    connections = int(os.environ.setdefault('LLM_MAX_CONNECTIONS', '256'))
+    for route in ('CHAT', 'CLEAN'):
+        os.environ.setdefault(f'ASYNC_{route}_CONCURRENCY', str(max(1, connections // 2)))
+        os.environ.setdefault(f'ASYNC_{route}_QUEUE', '100000')
+    os.environ.setdefault('ASYNC_QUEUE_TIMEOUT', '3600')
+    # Not under gunicorn: size the thread budget check (admission.py) to match
+    os.environ.setdefault('GUNICORN_THREADS', '1000000')
+    sys.path.insert(0, HERE)
+    os.chdir(tmpdir)
+
+    import app as flask_module
+    client = flask_module.app.test_client()
+    client.post('/register', data={'username': 'bench', 'email': 'b@x', 'password': 'pw'})
+    client.post('/login', data={'username': 'bench', 'password': 'pw'})
+    return flask_module, client.get_cookie('session').value
+
+def bench_sync(flask_module, cookie, total, threads):
+    """ One sync worker with `threads` threads: each thread blocks for the whole LLM call. """
+    remaining = [total]
+    lock = threading.Lock()
+
+    def worker():
+        client = flask_module.app.test_client()
+        client.set_cookie('session', cookie)
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            r = client.post('/api/chat', json={"message": CHAT_PROMPT})
+            assert r.status_code == 200, r.status_code
+
+    t0 = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - t0
+
+async def bench_async(cookie, total):
+    import httpx
+    from asgi import application
+
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url='http://asgi',
+                                 headers={'cookie': f'session={cookie}'}, timeout=120) as client:
+        async def one(i):
+            if i % 2:
+                r = await client.post('/api/receipt/clean', json={"text": "FAKE MART 120.50"})
+            else:
+                r = await client.post('/api/chat', json={"message": CHAT_PROMPT})
+            assert r.status_code == 200, (r.status_code, r.text)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return time.perf_counter() - t0
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    llm = FakeLLM(latency)
+    llm.start()
+    flask_module, cookie = setup_app(llm.port, tempfile.mkdtemp(prefix='llm_bench_'))
+    print(f"🤖 Fake LLM on :{llm.port} with {latency * 1000:.0f} ms latency, {total} requests\n")
+
+    sync_total = min(total, threads * 10)
+    elapsed = bench_sync(flask_module, cookie, sync_total, threads)
+    print(f"   sync  ({threads:>3} threads) {sync_total:>6} req in {elapsed:6.2f} s  "
+          f"-> {sync_total / elapsed:8.1f} req/s, peak in-flight LLM calls: {llm.peak}")
+    assert llm.served == sync_total, f"only {llm.served} of {sync_total} requests reached the LLM"
+
+    llm.reset()
+    elapsed = asyncio.run(bench_async(cookie, total))
+    print(f"   async (1 event loop) {total:>6} req in {elapsed:6.2f} s  "
+          f"-> {total / elapsed:8.1f} req/s, peak in-flight LLM calls: {llm.peak}")
+    assert llm.served == total, f"only {llm.served} of {total} requests reached the LLM"
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import flagging
+
+# Benchmarks the flagging engine on a synthetic ledger.
+# Usage: python bench_flagging.py [rows] [users]
+
+CATEGORIES = np.array(['Food', 'Travel', 'Shopping', 'Utilities', 'Medical', 'Other'])
+MERCHANTS = np.array([f"Merchant {i}" for i in range(500)])
+SPIKE_FACTOR = 25
+
+def synthetic_ledger(rows, users, seed=7):
+    rng = np.random.default_rng(seed)
+    amount = np.round(rng.lognormal(6, 0.6, rows), 2)
+    # ~0.1% spikes and ~0.5% duplicates of the previous row
+    spikes = rng.random(rows) < 0.001
+    amount[spikes] *= SPIKE_FACTOR
+    df = pd.DataFrame({
+        'id': np.arange(1, rows + 1),
+        'user_id': rng.integers(1, users + 1, rows),
+        'date': (np.datetime64('2023-01-01') + rng.integers(0, 730, rows).astype('timedelta64[D]')).astype(str),
+        'merchant': MERCHANTS[rng.integers(0, len(MERCHANTS), rows)],
+        'amount': amount,
+        'currency': 'INR',
+        'base_amount': amount,
+        'category': CATEGORIES[rng.integers(0, len(CATEGORIES), rows)],
+        'type': np.where(rng.random(rows) < 0.05, 'Credit', 'Debit'),
+        'is_flagged': 0,
+        'flag_reason': None,
+    })
+    dup = np.flatnonzero(rng.random(rows) < 0.005)
+    dup = dup[dup > 0]
+    for col in ('user_id', 'date', 'merchant', 'amount', 'base_amount', 'category', 'type'):
+        df.loc[dup, col] = df.loc[dup - 1, col].to_numpy()
+    spikes[dup] = spikes[dup - 1]
+    # Ground truth for the spike detector: injected spikes that are debits
+    df.attrs['spike_ids'] = set(df.loc[spikes & (df['type'] == 'Debit').to_numpy(), 'id'].tolist())
+    return df
+
+def spike_accuracy(df, spikes):
+    """ Precision/recall of the detected spikes against the injected ones. """
+    truth, found = df.attrs['spike_ids'], set(spikes.index.tolist())
+    hits = len(truth & found)
+    precision = hits / len(found) if found else 1.0
+    recall = hits / len(truth) if truth else 1.0
+    debits = df[df['type'] == 'Debit'].sort_values(['user_id', 'category', 'date', 'id'], kind='mergesort')
+    # Spikes with too little category history can't be scored at all
+    history = debits.groupby(['user_id', 'category']).cumcount()
+    scorable = truth & set(debits.loc[history >= flagging.MIN_HISTORY, 'id'].tolist())
+    normal = len(debits) - len(truth)
+    print(f"   -> spikes: {len(truth):,} injected, {len(found):,} flagged, {hits:,} caught: "
+          f"precision {precision:.1%}, recall {recall:.1%} "
+          f"({len(truth & found & scorable) / max(len(scorable), 1):.1%} of the {len(scorable):,} with history)")
+    print(f"   -> {len(found) - hits:,} of {normal:,} normal debits flagged ({(len(found) - hits) / max(normal, 1):.3%})")
+
+def timed(label, fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    print(f"   {label:<32}{elapsed:8.2f} s")
+    return result, elapsed
+
+def pairwise_duplicates(df, window_days=flagging.DUPLICATE_WINDOW_DAYS):
+    """ The naive O(n^2) scan, for comparison on a small sample. """
+    rows = list(zip(df['id'], df['user_id'], df['type'], df['merchant'].str.lower(),
+                    np.round(df['amount'] * 100), pd.to_datetime(df['date'])))
+    found = 0
+    window = pd.Timedelta(days=window_days)
+    for i, a in enumerate(rows):
+        for b in rows[:i]:
+            if a[1:5] == b[1:5] and abs(a[5] - b[5]) <= window:
+                found += 1
+                break
+    return found
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+
+    print(f"🧪 Generating {rows:,} transactions for {users:,} users...")
+    df = synthetic_ledger(rows, users)
+
+    print("\n⚙️  In-memory engine")
+    dups, t_dup = timed("sort-and-sweep duplicates", flagging.find_duplicates, df)
+    spikes, _ = timed("rolling category baselines", flagging.find_spikes, df)
+    reasons, _ = timed("compute_flags (both)", flagging.compute_flags, df)
+    print(f"   -> {len(dups):,} duplicates, {len(spikes):,} spikes, {len(reasons):,} rows flagged")
+    spike_accuracy(df, spikes)
+
+    sample = df.head(3000)
+    _, t_pair = timed("pairwise scan, 3,000 rows", pairwise_duplicates, sample)
+    print(f"   -> pairwise extrapolated to {rows:,} rows: ~{t_pair * (rows / len(sample)) ** 2 / 3600:,.0f} h "
+          f"vs {t_dup:.2f} s")
+
+    print("\n💾 SQLite round trip")
+    path = os.path.join(tempfile.mkdtemp(prefix='flag_bench_'), 'expenses.db')
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('''CREATE TABLE expenses (id INTEGER PRIMARY KEY, user_id INTEGER, date TEXT, merchant TEXT,
+                    amount REAL, currency TEXT, base_amount REAL, category TEXT, type TEXT,
+                    is_flagged INTEGER DEFAULT 0, flag_reason TEXT)''')
+    timed("bulk insert", lambda: (df.to_sql('expenses', conn, if_exists='append', index=False), conn.commit()))
+    loaded, _ = timed("load_frame", flagging.load_frame, conn)
+    result, _ = timed("compute + write_flags", lambda: flagging.write_flags(conn, loaded, flagging.compute_flags(loaded)))
+    print(f"   -> set {result[0]:,} flags, cleared {result[1]:,}")
+    _, _ = timed("re-run (nothing changes)", flagging.flag_users, conn)
+    conn.close()
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import statistics
+
+from PIL import Image, ImageDraw, ImageFont
+
+import ocr_engine
+from ocr_engine import extract_text, parse_receipt_data
+
+# Compares per-receipt OCR latency and field accuracy for:
+#   backend: pytesseract (process per call) vs pooled tesserocr engines
+#   mode:    full receipt vs header/totals regions
+#
+# Usage: python bench_ocr.py [sample_dir]
+# sample_dir holds receipt images plus a <name>.json next to each one with the
+# expected {"merchant": ..., "date": "DD/MM/YYYY", "amount": ...}. Without it a
+# synthetic set is generated.
+
+MERCHANTS = ["Sharma Sweets", "Big Bazaar", "Cafe Coffee Day", "Apollo Pharmacy",
+             "Reliance Fresh", "Haldirams", "Metro Cash Carry", "Croma Store"]
+ITEMS = ["Paneer Tikka", "Masala Dosa", "Milk 1L", "Bread", "Detergent", "Rice 5kg",
+         "Notebook", "Coffee", "Biscuits", "Shampoo", "Tomatoes", "Onions"]
+
+def make_receipt(path, rng):
+    """ Draws a plain receipt: header, item list, totals and footer. """
+    merchant = rng.choice(MERCHANTS)
+    day, month = rng.randint(13, 28), rng.randint(1, 12)
+    date_str = f"{day:02d}/{month:02d}/2025"
+    items = [(rng.choice(ITEMS), rng.randint(20, 900) + 0.5) for _ in range(rng.randint(8, 20))]
+    total = round(sum(a for _, a in items), 2)
+
+    font = ImageFont.load_default(size=26)
+    lines = [merchant.upper(), "GSTIN 27ABCDE1234F1Z5", f"Date: {date_str}", "-" * 32]
+    lines += [f"{name:<18}{amt:>10.2f}" for name, amt in items]
+    lines += ["-" * 32, f"TOTAL {total:>20,.2f}", "", "Thank you, visit again"]
+
+    img = Image.new('RGB', (620, 60 + 36 * len(lines)), (255, 255, 255))
+    d = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        d.text((30, 30 + 36 * i), line, fill=(0, 0, 0), font=font)
+    img.save(path)
+    return {"merchant": merchant, "date": date_str, "amount": total}
+
+def load_samples(sample_dir):
+    samples = []
+    for name in sorted(os.listdir(sample_dir)):
+        stem, ext = os.path.splitext(name)
+        truth = os.path.join(sample_dir, stem + '.json')
+        if ext.lower() in ('.png', '.jpg', '.jpeg') and os.path.exists(truth):
+            with open(truth) as f:
+                samples.append((os.path.join(sample_dir, name), json.load(f)))
+    return samples
+
+def synthetic_samples(count=20):
+    rng = random.Random(42)
+    tmp = tempfile.mkdtemp(prefix='ocr_bench_')
+    return [(path, make_receipt(path, rng))
+            for path in (os.path.join(tmp, f"receipt_{i:03d}.png") for i in range(count))]
+
+def score(text, truth):
+    """ Returns hits for merchant, date and amount. """
+    parsed = parse_receipt_data(text)
+    return (
+        truth['merchant'].lower() in text.lower(),
+        truth['date'] in text,
+        abs(parsed['amount'] - float(truth['amount'])) < 0.01,
+    )
+
+def run(samples, mode, use_pool):
+    # Warm up: the first pooled call loads the language data
+    extract_text(samples[0][0], mode=mode, use_pool=use_pool)
+    latencies, hits = [], []
+    for path, truth in samples:
+        t0 = time.perf_counter()
+        text = extract_text(path, mode=mode, use_pool=use_pool)
+        latencies.append(time.perf_counter() - t0)
+        hits.append(score(text, truth))
+    return latencies, hits
+
+if __name__ == "__main__":
+    samples = load_samples(sys.argv[1]) if len(sys.argv) > 1 else synthetic_samples()
+    if not samples:
+        sys.exit("❌ No samples found.")
+    print(f"🧾 {len(samples)} receipts\n")
+
+    backends = [("pytesseract", False)]
+    if ocr_engine.get_ocr_pool() is not None:
+        backends.append(("pool", True))
+    else:
+        print("⚠️  tesserocr not installed or not working: skipping the persistent engine pool.\n")
+
+    print(f"   {'backend':<12}{'mode':<9}{'median':>9}{'p95':>9}{'merchant':>10}{'date':>7}{'amount':>8}")
+    for backend, use_pool in backends:
+        for mode in ('full', 'regions'):
+            latencies, hits = run(samples, mode, use_pool)
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            acc = [100.0 * sum(h[i] for h in hits) / len(hits) for i in range(3)]
+            print(f"   {backend:<12}{mode:<9}{statistics.median(latencies) * 1000:7.0f}ms"
+                  f"{p95 * 1000:7.0f}ms{acc[0]:9.0f}%{acc[1]:6.0f}%{acc[2]:7.0f}%")
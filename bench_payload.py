@@ -0,0 +1,108 @@
+import os
+import sys
+import gzip
+import json
+import time
+import sqlite3
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+import database
+import payloads
+
+# Measures /api/expenses payload size, encode time and peak memory for the old
+# jsonify(list of dicts) response vs the streamed row and columnar encodings.
+# Usage: python bench_payload.py [rows]
+
+CATEGORIES = np.array(['Food', 'Travel', 'Shopping', 'Utilities', 'Medical', 'Other'])
+MERCHANTS = np.array([f"Merchant {i}" for i in range(500)])
+MODES = np.array(['UPI', 'Cash', 'Card', 'NetBanking'])
+
+def build_db(rows):
+    path = os.path.join(tempfile.mkdtemp(prefix='payload_bench_'), 'expenses.db')
+    conn = sqlite3.connect(path)
+    database.create_user_tables(conn.cursor())
+    rng = np.random.default_rng(3)
+    amount = np.round(rng.lognormal(6, 0.6, rows), 2)
+    days = (np.datetime64('2025-01-01') + rng.integers(0, 365, rows).astype('timedelta64[D]')).astype(str)
+    conn.executemany('''INSERT INTO expenses (user_id, date, merchant, amount, currency, base_amount, category,
+                        type, payment_mode, notes, source) VALUES (1, ?, ?, ?, 'INR', ?, ?, ?, ?, '', 'manual')''',
+                     zip(days.tolist(), MERCHANTS[rng.integers(0, len(MERCHANTS), rows)].tolist(), amount.tolist(),
+                         amount.tolist(), CATEGORIES[rng.integers(0, len(CATEGORIES), rows)].tolist(),
+                         np.where(rng.random(rows) < 0.05, 'Credit', 'Debit').tolist(),
+                         MODES[rng.integers(0, len(MODES), rows)].tolist()))
+    conn.commit()
+    conn.close()
+    return path
+
+def cursor_for(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn, conn.execute('SELECT * FROM expenses WHERE user_id = ? ORDER BY date DESC', (1,))
+
+def old_response(path, encoding):
+    """ What the endpoint did before: fetchall, list of dicts, one json.dumps (as jsonify). """
+    conn, cursor = cursor_for(path)
+    body = json.dumps([dict(row) for row in cursor.fetchall()], separators=(',', ':'), sort_keys=True).encode()
+    conn.close()
+    return len(gzip.compress(body, payloads.GZIP_LEVEL) if encoding == 'gzip' else body)
+
+def streamed(path, columnar, encoding):
+    """ Sends the chunks nowhere, like a socket would: only the size is kept. """
+    conn, cursor = cursor_for(path)
+    size = sum(len(chunk) for chunk in payloads.stream_json(cursor, columnar, encoding))
+    conn.close()
+    return size
+
+def body(path, columnar=False, encoding=None):
+    conn, cursor = cursor_for(path)
+    data = b''.join(payloads.stream_json(cursor, columnar, encoding))
+    conn.close()
+    return data
+
+def decompress(data, encoding):
+    if encoding == 'br':
+        return payloads.brotli.decompress(data)
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    return data
+
+def measure(label, fn, *args):
+    t0 = time.perf_counter()
+    size = fn(*args)
+    elapsed = time.perf_counter() - t0
+    # Memory in a second pass: tracemalloc slows everything down
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"   {label:<28}{size / 1e6:9.2f} MB{elapsed:9.2f} s{peak / 1e6:10.1f} MB peak")
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"🧪 {rows:,} expense rows")
+    path = build_db(rows)
+
+    encodings = [None, 'gzip'] + (['br'] if payloads.brotli else [])
+    print(f"   {'':<28}{'size':>12}{'time':>11}{'memory':>15}")
+    measure("jsonify list (old)", old_response, path, None)
+    measure("jsonify list + gzip", old_response, path, 'gzip')
+    for encoding in encodings:
+        measure(f"streamed rows {encoding or 'raw'}", streamed, path, False, encoding)
+    for encoding in encodings:
+        measure(f"columnar {encoding or 'raw'}", streamed, path, True, encoding)
+
+    conn, cursor = cursor_for(path)
+    reference = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    for encoding in encodings[1:]:
+        same = all(decompress(body(path, columnar, encoding), encoding) == body(path, columnar)
+                   for columnar in (False, True))
+        print(f"✅ {encoding} decodes to the raw stream" if same else f"❌ {encoding} decode mismatch")
+    payload = json.loads(body(path, columnar=True))
+    names, dicts = payload['columns'], payload['dictionaries']
+    decoded = [{c: (dicts[c][v] if c in dicts and v is not None else v) for c, v in zip(names, values)}
+               for block in payload['blocks'] for values in zip(*block)]
+    print("✅ columnar decodes to the same rows" if decoded == reference else "❌ columnar decode mismatch")
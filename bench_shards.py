@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import tempfile
+import multiprocessing as mp
+
+# Benchmarks concurrent expense writes with one SQLite file vs per-user shards.
+# Each worker process plays a handful of users and commits every insert, like the API does.
+# Usage: python bench_shards.py [workers] [shards] [seconds]
+
+USERS = 64
+
+def writer(workdir, shards, seconds, worker, workers, counter):
+    os.chdir(workdir)
+    os.environ['DB_SHARDS'] = str(shards)
+    import database
+
+    users = [u for u in range(1, USERS + 1) if u % workers == worker]
+    done = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        user_id = users[done % len(users)]
+        conn = database.get_db_connection(user_id)
+        conn.execute('''INSERT INTO expenses (user_id, date, merchant, amount, category, type)
+                        VALUES (?, '2026-10-01', 'Bench', 10, 'Food', 'Debit')''', (user_id,))
+        conn.commit()
+        conn.close()
+        done += 1
+    with counter.get_lock():
+        counter.value += done
+
+def run(workers, shards, seconds):
+    workdir = tempfile.mkdtemp(prefix='shard_bench_')
+    os.chdir(workdir)
+    os.environ['DB_SHARDS'] = str(shards)
+    import importlib
+    import database
+    importlib.reload(database)
+    database.init_db()
+    conn = database.get_db_connection()
+    for user_id in range(1, USERS + 1):
+        conn.execute("INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'x')", (user_id, f'u{user_id}'))
+        database.assign_shard(conn, user_id)
+    conn.commit()
+    conn.close()
+
+    counter = mp.Value('i', 0)
+    procs = [mp.Process(target=writer, args=(workdir, shards, seconds, w, workers, counter)) for w in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    return counter.value / seconds
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    shards = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    print(f"🧪 {workers} writer processes, {USERS} users, {seconds:g} s per run, one commit per insert")
+    single = run(workers, 0, seconds)
+    print(f"   single file         {single:10,.0f} inserts/s")
+    sharded = run(workers, shards, seconds)
+    print(f"   {shards} shards{'':<11}{sharded:10,.0f} inserts/s   ({sharded / single:.1f}x)")
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import statistics
+import subprocess
+
+# Benchmarks worker startup in the three gunicorn modes:
+#   lazy    -> heavy libs load on first use of /api/export, /api/upload, /api/chat
+#   eager   -> every worker imports heavy libs itself (PRELOAD_HEAVY_MODULES=1, no --preload)
+#   preload -> master imports everything once, workers share it copy-on-write (--preload)
+#
+# Usage: python bench_startup.py [workers] [runs]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_PROBE = """
+import json, resource, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.preload_heavy_modules()
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_app": t1 - t0,
+    "first_heavy_use": t2 - t1,
+    "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+def run_import_probe(preload):
+    env = dict(os.environ)
+    env.pop('PRELOAD_HEAVY_MODULES', None)
+    if preload:
+        env['PRELOAD_HEAVY_MODULES'] = '1'
+    out = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=HERE, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def bench_import_time(runs):
+    print("⏱️  Cold import of app.py (median of %d runs)" % runs)
+    for label, preload in (("lazy", False), ("eager", True)):
+        samples = [run_import_probe(preload) for _ in range(runs)]
+        imp = statistics.median(s['import_app'] for s in samples)
+        heavy = statistics.median(s['first_heavy_use'] for s in samples)
+        print(f"   {label:<8} import app: {imp * 1000:8.1f} ms   "
+              f"first heavy request pays: {heavy * 1000:8.1f} ms")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def read_memory_kb(pid):
+    """ Returns (Rss, Pss) in kB. Pss splits shared pages between the processes sharing them. """
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return values.get('Rss', 0), values.get('Pss', 0)
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+def wait_for_port(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def bench_gunicorn(mode, workers):
+    port = free_port()
+    env = dict(os.environ)
+    env.pop('PRELOAD_HEAVY_MODULES', None)
+    # The repo config, explicitly; preload is set through GUNICORN_PRELOAD because that
+    # config would otherwise turn it on for 'eager' too (it follows PRELOAD_HEAVY_MODULES)
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(HERE, 'gunicorn.conf.py'),
+           '-w', str(workers), '-b', f'127.0.0.1:{port}', 'app:app']
+    if mode in ('eager', 'preload'):
+        env['PRELOAD_HEAVY_MODULES'] = '1'
+    env['GUNICORN_PRELOAD'] = '1' if mode == 'preload' else '0'
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(port):
+            print(f"   {mode:<8} ❌ gunicorn did not start")
+            return
+        # Workers boot after the port is bound; give them a moment to finish importing
+        pids = []
+        while time.perf_counter() - t0 < 60:
+            pids = worker_pids(proc.pid)
+            if len(pids) == workers:
+                break
+            time.sleep(0.1)
+        time.sleep(2)
+        ready = time.perf_counter() - t0
+
+        mem = [read_memory_kb(pid) for pid in worker_pids(proc.pid)]
+        master = read_memory_kb(proc.pid)
+        rss = statistics.mean(m[0] for m in mem) / 1024
+        pss = statistics.mean(m[1] for m in mem) / 1024
+        total = (sum(m[1] for m in mem) + master[1]) / 1024
+        print(f"   {mode:<8} ready: {ready:6.2f} s   per-worker RSS: {rss:7.1f} MB   "
+              f"per-worker PSS: {pss:7.1f} MB   total PSS: {total:7.1f} MB")
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    bench_import_time(runs)
+
+    print(f"\n🧠 Gunicorn footprint with {workers} idle workers")
+    for mode in ('lazy', 'eager', 'preload'):
+        bench_gunicorn(mode, workers)
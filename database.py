@@ -1,32 +1,112 @@
+import os
 import sqlite3
 
+from flask import g, has_request_context
+
 DB_NAME = 'expenses.db'
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+# --- SHARDING ---
+# DB_NAME is the directory database: users, images and the user -> shard map. Per-user
+# data (expenses, budgets, image_refs) lives in the user's shard, so users on different
+# shards don't queue behind each other's write locks. Users without a directory entry
+# live in the 'main' shard, which is DB_NAME itself: with DB_SHARDS=0 (the default)
+# everything stays in the single file exactly as before.
+SHARD_FOLDER = os.environ.get('SHARD_FOLDER', 'shards')
+SHARD_COUNT = int(os.environ.get('DB_SHARDS', '0'))
+MAIN_SHARD = 'main'
+# Each shard allocates ids from its own range, so ids stay unique across shards. A shard
+# must only ever hold ids from its own range: AUTOINCREMENT continues from the largest id
+# in the table, so one foreign id would drag the counter into another shard's range.
+# That's why sharding.move_user gives moved rows new ids.
+SHARD_ID_STRIDE = 10 ** 12
+USER_TABLES = ('expenses', 'budgets', 'image_refs')
+
+def shard_names():
+    return [MAIN_SHARD] + [f'shard_{i:02d}' for i in range(SHARD_COUNT)]
+
+def shard_path(name):
+    return DB_NAME if name == MAIN_SHARD else os.path.join(SHARD_FOLDER, f'{name}.db')
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    # 1. Users Table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT,
-            password_hash TEXT NOT NULL,
-            full_name TEXT,
-            age INTEGER,
-            occupation TEXT,
-            role TEXT,
-            monthly_budget REAL DEFAULT 0
-        )
-    ''')
+def connect_shard(name):
+    """
+    Opens a shard with the directory attached, so users/images stay reachable from the
+    same connection (SQLite resolves unqualified tables missing from the shard there).
+    """
+    if name == MAIN_SHARD:
+        return _connect(DB_NAME)
+    conn = _connect(shard_path(name))
+    conn.execute('ATTACH DATABASE ? AS directory', (DB_NAME,))
+    return conn
+
+def shard_for_user(user_id, conn=None):
+    """ Looked up on every connection (one indexed read) so moves take effect at once. """
+    own = conn is None
+    conn = conn or _connect(DB_NAME)
+    row = conn.execute('SELECT shard FROM user_shards WHERE user_id=?', (user_id,)).fetchone()
+    if own:
+        conn.close()
+    return row['shard'] if row else MAIN_SHARD
+
+def assign_shard(conn, user_id):
+    """ Places a new user on a shard (no-op when sharding is off). Caller commits. """
+    if SHARD_COUNT <= 0:
+        return MAIN_SHARD
+    name = f'shard_{int(user_id) % SHARD_COUNT:02d}'
+    conn.execute('INSERT OR REPLACE INTO user_shards (user_id, shard) VALUES (?, ?)', (user_id, name))
+    return name
+
+def _request_user_id():
+    # Read what Flask-Login already loaded instead of touching current_user: the user
+    # loader itself calls get_db_connection(), which would recurse
+    if has_request_context():
+        user = g.get('_login_user')
+        if user is not None and getattr(user, 'is_authenticated', False):
+            return user.id
+    return None
 
-    # 2. Expenses Table
+def get_db_connection(user_id=None):
+    """
+    Connection for `user_id`'s shard; defaults to the logged-in user. Outside a login
+    (auth pages, scripts) it's the directory database.
+    """
+    if user_id is None:
+        user_id = _request_user_id()
+    if user_id is None:
+        return _connect(DB_NAME)
+    return connect_shard(shard_for_user(user_id))
+
+def iter_shards():
+    """ Yields (name, connection) for every shard, for admin and batch jobs. """
+    for name in shard_names():
+        if name != MAIN_SHARD and not os.path.exists(shard_path(name)):
+            continue
+        conn = connect_shard(name)
+        try:
+            yield name, conn
+        finally:
+            conn.close()
+
+def query_all_shards(sql, params=()):
+    """ Runs a read query on every shard and returns the rows as dicts tagged with '_shard'. """
+    rows = []
+    for name, conn in iter_shards():
+        rows.extend(dict(r, _shard=name) for r in conn.execute(sql, params).fetchall())
+    return rows
+
+def add_column_if_missing(cursor, table, column, decl):
+    """ Lightweight migration: CREATE TABLE IF NOT EXISTS won't add new columns to old DBs. """
+    cols = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    if column not in cols:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+def create_user_tables(c):
+    """ Per-user data: lives in every shard (and in DB_NAME as the 'main' shard). """
+    # 1. Expenses Table
     c.execute('''
         CREATE TABLE IF NOT EXISTS expenses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -46,8 +126,12 @@ def init_db():
             FOREIGN KEY(user_id) REFERENCES users(id)
         )
     ''')
+    # Content hash of the stored receipt image (see storage.py)
+    add_column_if_missing(c, 'expenses', 'image_key', 'TEXT')
+    # Amount in the base currency, computed on write (see fx.py)
+    add_column_if_missing(c, 'expenses', 'base_amount', 'REAL')
 
-    # 3. Budgets Table (UPDATED FOR DATE RANGES)
+    # 2. Budgets Table (UPDATED FOR DATE RANGES)
     # Replaced 'monthly_limit' with 'amount', 'start_date', 'end_date'
     c.execute('''
         CREATE TABLE IF NOT EXISTS budgets (
@@ -60,6 +144,94 @@ def init_db():
             FOREIGN KEY(user_id) REFERENCES users(id)
         )
     ''')
+
+    # 3. Image References (which users uploaded which image)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS image_refs (
+            user_id INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            original_name TEXT,
+            created_at TEXT,
+            PRIMARY KEY(user_id, digest),
+            FOREIGN KEY(user_id) REFERENCES users(id),
+            FOREIGN KEY(digest) REFERENCES images(digest)
+        )
+    ''')
+
+    # 4. Users moved off this shard: late writes from a request that routed here before
+    # the move are rejected instead of being silently stranded
+    c.execute('CREATE TABLE IF NOT EXISTS moved_users (user_id INTEGER PRIMARY KEY)')
+    for table in USER_TABLES:
+        for event in ('INSERT', 'UPDATE'):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS reject_moved_{table}_{event.lower()}
+                BEFORE {event} ON {table}
+                WHEN EXISTS (SELECT 1 FROM moved_users WHERE user_id = NEW.user_id)
+                BEGIN SELECT RAISE(ABORT, 'user moved to another shard'); END
+            ''')
+
+ID_TABLES = ('expenses', 'budgets')
+
+def id_range(name):
+    """ [lo, hi) of the ids `name` hands out. """
+    base = shard_names().index(name) * SHARD_ID_STRIDE
+    return base, base + SHARD_ID_STRIDE
+
+def init_shard(name):
+    """ Creates a shard file and starts its id sequences in the shard's own range. """
+    os.makedirs(SHARD_FOLDER, exist_ok=True)
+    conn = sqlite3.connect(shard_path(name))
+    c = conn.cursor()
+    create_user_tables(c)
+    for table in ID_TABLES:
+        if not c.execute('SELECT 1 FROM sqlite_sequence WHERE name=?', (table,)).fetchone():
+            c.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, id_range(name)[0]))
+    conn.commit()
+    conn.close()
+
+def init_db():
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    
+    # 1. Users Table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT,
+            password_hash TEXT NOT NULL,
+            full_name TEXT,
+            age INTEGER,
+            occupation TEXT,
+            role TEXT,
+            monthly_budget REAL DEFAULT 0
+        )
+    ''')
+
+    # 2. Shard Directory: which shard holds each user's data (no row = 'main')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+
+    # 3. Receipt Images (content-addressed, one row per unique file)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            digest TEXT PRIMARY KEY,
+            mime TEXT,
+            size INTEGER,
+            created_at TEXT
+        )
+    ''')
+
+    # 4. Per-user tables: this file is also the 'main' shard
+    create_user_tables(c)
     
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+    for name in shard_names()[1:]:
+        init_shard(name)
\ No newline at end of file
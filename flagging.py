@@ -0,0 +1,266 @@
+import sys
+import math
+import statistics
+from datetime import datetime, timedelta
+
+from database import iter_shards
+
+# --- SPENDING ANOMALY & DUPLICATE FLAGGING ---
+# Batch mode (pandas/NumPy) re-scores whole ledgers; incremental mode scores one new or
+# edited row in plain Python so the CRUD endpoints don't have to import pandas.
+#
+# Spike:     a debit far above the user's recent spend in that category, compared in the
+#            base currency (base_amount, see fx.py). The baseline is
+#            the previous BASELINE_WINDOW debits of the category (never the row itself), and
+#            the row must clear the z-score, the IQR fence and be SPIKE_MIN_RATIO times the
+#            usual (geometric mean) amount. All three work on log(1 + amount): spend is
+#            heavy-tailed, and on raw amounts ordinary big purchases cleared the fences
+#            (~2% of debits flagged, ~4% of flags real in bench_flagging.py). The ratio
+#            floor keeps baselines of a handful of rows, whose spread is underestimated,
+#            from flagging every mildly larger bill.
+# Duplicate: same user, type, merchant, currency and amount within DUPLICATE_WINDOW_DAYS. Found by
+#            sorting on that key + date and comparing each row with its predecessor
+#            (sort-and-sweep) instead of comparing every pair.
+
+BASELINE_WINDOW = 30
+MIN_HISTORY = 5
+Z_THRESHOLD = 3.0
+IQR_K = 1.5
+SPIKE_MIN_RATIO = 10.0
+DUPLICATE_WINDOW_DAYS = 3
+
+# Reasons written by this engine start with these, so a re-run can clear its own stale
+# flags without touching the ones set elsewhere (e.g. the image pHash check on upload)
+DUPLICATE_PREFIX = "Possible duplicate of ID"
+SPIKE_PREFIX = "Unusual spend"
+
+# Rows written before base_amount existed (and not yet backfilled) count at face value
+COLUMNS = ('id, user_id, date, merchant, amount, currency, COALESCE(base_amount, amount) AS base_amount, '
+           'category, type, is_flagged, flag_reason')
+
+def is_engine_reason(reason):
+    return isinstance(reason, str) and reason.startswith((DUPLICATE_PREFIX, SPIKE_PREFIX))
+
+def spike_reason(amount, usual, category):
+    return f"{SPIKE_PREFIX}: {amount:,.2f} vs usual {usual:,.2f} for {category}"
+
+def to_log(amount):
+    return math.log1p(max(amount or 0.0, 0.0))
+
+# --- BATCH (vectorized) ---
+
+def load_frame(conn, user_ids=None):
+    import pandas as pd
+
+    query = f"SELECT {COLUMNS} FROM expenses"
+    params = []
+    if user_ids:
+        query += f" WHERE user_id IN ({','.join(['?'] * len(user_ids))})"
+        params = list(user_ids)
+    return pd.read_sql_query(query, conn, params=params)
+
+def find_duplicates(df, window_days=DUPLICATE_WINDOW_DAYS):
+    """ Returns a Series id -> id of the earlier matching row. """
+    import numpy as np
+    import pandas as pd
+
+    work = pd.DataFrame({
+        'id': df['id'].to_numpy(),
+        'user_id': df['user_id'].to_numpy(),
+        'type': df['type'].fillna(''),
+        'merchant': df['merchant'].fillna('').str.strip().str.lower(),
+        'currency': df['currency'].fillna('').str.strip().str.upper(),
+        'cents': np.round(df['amount'].fillna(0).to_numpy() * 100).astype(np.int64),
+        'day': pd.to_datetime(df['date'], errors='coerce').to_numpy(),
+    })
+    work = work.dropna(subset=['day'])
+    work = work.sort_values(['user_id', 'type', 'merchant', 'currency', 'cents', 'day', 'id'], kind='mergesort')
+
+    same_key = np.ones(len(work), dtype=bool)
+    for col in ('user_id', 'type', 'merchant', 'currency', 'cents'):
+        values = work[col].to_numpy()
+        same_key[1:] &= values[1:] == values[:-1]
+    same_key[0] = False
+
+    day = work['day'].to_numpy()
+    gap = np.empty(len(work), dtype='timedelta64[ns]')
+    gap[1:] = day[1:] - day[:-1]
+    gap[:1] = np.timedelta64(0, 'ns')
+    dup = same_key & (gap <= np.timedelta64(window_days, 'D'))
+
+    ids = work['id'].to_numpy()
+    prev_ids = np.empty_like(ids)
+    prev_ids[1:] = ids[:-1]
+    prev_ids[:1] = 0
+    return pd.Series(prev_ids[dup], index=ids[dup])
+
+def prior_window_stats(amount, group_start, window=BASELINE_WINDOW, min_history=MIN_HISTORY, chunk=100_000):
+    """
+    For each row of a group-sorted array: mean, std, Q1 and Q3 of the up to `window`
+    previous amounts in the same group (NaN with fewer than `min_history`).
+    Works on (chunk x window) matrices of lagged values, so there's no per-group Python loop.
+    """
+    import numpy as np
+
+    n = len(amount)
+    out = np.full((4, n), np.nan)
+    lags = np.arange(1, window + 1)
+    for lo in range(0, n, chunk):
+        hi = min(n, lo + chunk)
+        rows = np.arange(lo, hi)
+        idx = rows[:, None] - lags[None, :]
+        valid = idx >= group_start[lo:hi, None]
+        prior = np.where(valid, amount[np.maximum(idx, 0)], np.nan)
+        count = valid.sum(axis=1)
+        ok = count >= min_history
+        if not ok.any():
+            continue
+        prior, count, rows = prior[ok], count[ok], rows[ok]
+
+        mean = np.nansum(prior, axis=1) / count
+        var = np.nansum((prior - mean[:, None]) ** 2, axis=1) / (count - 1)
+        # Linear-interpolated quartiles over the valid values (NaNs sort last)
+        ordered = np.sort(prior, axis=1)
+        quartiles = []
+        for q in (0.25, 0.75):
+            pos = q * (count - 1)
+            below = np.floor(pos).astype(np.int64)
+            above = np.minimum(below + 1, count - 1)
+            r = np.arange(len(count))
+            frac = pos - below
+            quartiles.append(ordered[r, below] * (1 - frac) + ordered[r, above] * frac)
+        out[:, rows] = mean, np.sqrt(var), quartiles[0], quartiles[1]
+    return out
+
+def find_spikes(df, window=BASELINE_WINDOW, min_history=MIN_HISTORY,
+                z_threshold=Z_THRESHOLD, iqr_k=IQR_K, min_ratio=SPIKE_MIN_RATIO):
+    """
+    Returns a Series id -> usual amount (geometric mean of the baseline) for debits far
+    above their category baseline.
+    """
+    import numpy as np
+    import pandas as pd
+
+    debits = df[df['type'] == 'Debit'][['id', 'user_id', 'category', 'base_amount', 'date']].copy()
+    debits['category'] = debits['category'].fillna('Other')
+    debits['day'] = pd.to_datetime(debits['date'], errors='coerce')
+    debits = debits.sort_values(['user_id', 'category', 'day', 'id'], kind='mergesort').reset_index(drop=True)
+
+    # Row index where each (user, category) run starts, broadcast to every row of the run
+    user = debits['user_id'].to_numpy()
+    category = debits['category'].to_numpy()
+    new_group = np.ones(len(debits), dtype=bool)
+    new_group[1:] = (user[1:] != user[:-1]) | (category[1:] != category[:-1])
+    group_start = np.maximum.accumulate(np.where(new_group, np.arange(len(debits)), 0))
+
+    amount = np.log1p(np.maximum(debits['base_amount'].fillna(0).to_numpy(dtype=float), 0))
+    mean, std, q1, q3 = prior_window_stats(amount, group_start, window, min_history)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (amount - mean) / np.where(std > 0, std, np.nan)
+    spike = (z > z_threshold) & (amount > q3 + iqr_k * (q3 - q1)) & (amount - mean > np.log(min_ratio))
+    return pd.Series(np.expm1(mean[spike]), index=debits['id'].to_numpy()[spike])
+
+def compute_flags(df):
+    """ Returns a dict id -> reason for every row the engine flags (duplicates win). """
+    reasons = {}
+    if df.empty:
+        return reasons
+    category = df.set_index('id')['category'].fillna('Other')
+    amount = df.set_index('id')['base_amount']
+    for row_id, usual in find_spikes(df).items():
+        reasons[int(row_id)] = spike_reason(amount[row_id], usual, category[row_id])
+    for row_id, prev_id in find_duplicates(df).items():
+        reasons[int(row_id)] = f"{DUPLICATE_PREFIX} {int(prev_id)}"
+    return reasons
+
+def write_flags(conn, df, reasons):
+    """
+    Bulk write-back. Rows flagged for other reasons are left alone; engine flags that
+    no longer apply are cleared. Returns (flagged, cleared).
+    """
+    current = dict(zip(df['id'].tolist(), df['flag_reason'].tolist()))
+    flagged = dict(zip(df['id'].tolist(), df['is_flagged'].fillna(0).tolist()))
+
+    to_set = [(reason, row_id) for row_id, reason in reasons.items()
+              if current.get(row_id) != reason and (not flagged.get(row_id) or is_engine_reason(current.get(row_id)))]
+    to_clear = [(row_id,) for row_id, reason in current.items()
+                if is_engine_reason(reason) and row_id not in reasons]
+
+    conn.executemany('UPDATE expenses SET is_flagged=1, flag_reason=? WHERE id=?', to_set)
+    conn.executemany('UPDATE expenses SET is_flagged=0, flag_reason=NULL WHERE id=?', to_clear)
+    conn.commit()
+    return len(to_set), len(to_clear)
+
+def flag_users(conn, user_ids=None):
+    df = load_frame(conn, user_ids)
+    return write_flags(conn, df, compute_flags(df))
+
+# --- INCREMENTAL (single row, no pandas) ---
+
+def score_expense(conn, user_id, expense_id):
+    """ Returns the engine reason for one row, or None. """
+    row = conn.execute(f'SELECT {COLUMNS} FROM expenses WHERE id=? AND user_id=?',
+                       (expense_id, user_id)).fetchone()
+    if not row or not row['date']:
+        return None
+
+    try:
+        day = datetime.strptime(row['date'][:10], '%Y-%m-%d')
+    except ValueError:
+        return None
+    lo = (day - timedelta(days=DUPLICATE_WINDOW_DAYS)).strftime('%Y-%m-%d')
+    hi = (day + timedelta(days=DUPLICATE_WINDOW_DAYS)).strftime('%Y-%m-%d')
+    # Only an earlier row counts as the original, matching the batch sweep's ordering
+    dup = conn.execute('''
+        SELECT id FROM expenses
+        WHERE user_id=? AND id != ? AND type IS ? AND LOWER(TRIM(merchant)) = LOWER(TRIM(?))
+        AND UPPER(TRIM(COALESCE(currency, ''))) = UPPER(TRIM(COALESCE(?, '')))
+        AND ROUND(amount * 100) = ROUND(? * 100) AND date >= ? AND date <= ?
+        AND (date < ? OR (date = ? AND id < ?))
+        ORDER BY date DESC, id DESC LIMIT 1
+    ''', (user_id, expense_id, row['type'], row['merchant'] or '', row['currency'], row['amount'], lo, hi,
+          row['date'], row['date'], expense_id)).fetchone()
+    if dup:
+        return f"{DUPLICATE_PREFIX} {dup['id']}"
+
+    if row['type'] != 'Debit':
+        return None
+    history = [to_log(r['base_amount']) for r in conn.execute('''
+        SELECT COALESCE(base_amount, amount) AS base_amount FROM expenses
+        WHERE user_id=? AND type='Debit' AND COALESCE(category, 'Other') = ?
+        AND (date < ? OR (date = ? AND id < ?))
+        ORDER BY date DESC, id DESC LIMIT ?
+    ''', (user_id, row['category'] or 'Other', row['date'], row['date'], expense_id, BASELINE_WINDOW))]
+    if len(history) < MIN_HISTORY:
+        return None
+    mean = statistics.fmean(history)
+    std = statistics.stdev(history)
+    q1, _, q3 = statistics.quantiles(history, n=4, method='inclusive')
+    amount = to_log(row['base_amount'])
+    if (std > 0 and (amount - mean) / std > Z_THRESHOLD and amount > q3 + IQR_K * (q3 - q1)
+            and amount - mean > math.log(SPIKE_MIN_RATIO)):
+        return spike_reason(row['base_amount'], math.expm1(mean), row['category'] or 'Other')
+    return None
+
+def flag_expense(conn, user_id, expense_id):
+    """ Scores one new/edited row and writes its flag (doesn't override other flags). """
+    row = conn.execute('SELECT is_flagged, flag_reason FROM expenses WHERE id=? AND user_id=?',
+                       (expense_id, user_id)).fetchone()
+    if not row or (row['is_flagged'] and not is_engine_reason(row['flag_reason'])):
+        return None
+    reason = score_expense(conn, user_id, expense_id)
+    if reason:
+        conn.execute('UPDATE expenses SET is_flagged=1, flag_reason=? WHERE id=?', (reason, expense_id))
+    elif is_engine_reason(row['flag_reason']):
+        conn.execute('UPDATE expenses SET is_flagged=0, flag_reason=NULL WHERE id=?', (expense_id,))
+    conn.commit()
+    return reason
+
+if __name__ == "__main__":
+    # python flagging.py [user_id ...]   (no ids = every user)
+    ids = [int(a) for a in sys.argv[1:]]
+    flagged = cleared = 0
+    for name, conn in iter_shards():
+        f, c = flag_users(conn, ids or None)
+        flagged, cleared = flagged + f, cleared + c
+    print(f"🚩 Flagged {flagged} transactions, cleared {cleared} stale flags.")
@@ -0,0 +1,191 @@
+import re
+import math
+from datetime import date, timedelta
+from itertools import accumulate
+
+import fx
+
+# --- BUDGET BURN-RATE FORECASTING ---
+# One grouped query per user pulls daily debit totals per category over the span of that
+# user's budgets (in the base currency, see fx.py) and every budget is projected from
+# their running sums: spent so far, average and last-7-day burn rate, projected
+# end-of-period spend and the day the limit is (or will be) crossed. Plain Python on
+# purpose: /api/budgets is hit on every dashboard load and must not import numpy in
+# lazy workers (see HEAVY_MODULES in app.py).
+#
+# Budgets whose dates are missing, malformed, reversed or more than MAX_SPAN_DAYS away from
+# today get no forecast (only spent/percentage, summed the old way), so one bad row can't
+# fail the whole list or blow up the running sums.
+
+RECENT_DAYS = 7
+MAX_SPAN_DAYS = 3660
+
+# "Will I blow my budget?", "am I on track?", "is my food budget going to run out?"...
+# Only questions about the user's own pace are answered locally, and only when they
+# mention a budget or one of the user's budget categories; "any tips to avoid
+# overspending?" and the like still go to the LLM (with the forecast in its context).
+BUDGET_QUESTION = re.compile(
+    r"\b(?:will|would|am|are|is|going to|gonna|do|does)\s+(?:i|we|my|our)\b.{0,60}?"
+    r"\b(?:blow|exceed|go(?:ing)? over|overspend(?:ing)?|over\s*spend|run(?:ning)? out|"
+    r"stay(?:ing)? (?:within|under)|on track|over (?:the |my |our )?budget)", re.IGNORECASE)
+
+def _parse(d):
+    """ date from an ISO 'YYYY-MM-DD...' string, None if it isn't one. """
+    try:
+        return date.fromisoformat(d[:10])
+    except (TypeError, ValueError):
+        return None
+
+def forecast_budgets(conn, user_id=None, today=None):
+    """
+    Returns the budgets of one user (or of everyone when user_id is None) with spend and
+    forecast fields, newest end date first.
+    """
+    today = today or date.today()
+    query = 'SELECT * FROM budgets'
+    params = []
+    if user_id is not None:
+        query += ' WHERE user_id=?'
+        params.append(user_id)
+    budgets = conn.execute(query + ' ORDER BY end_date DESC', params).fetchall()
+
+    # One matrix per user: its span is bounded by that user's budgets, not everyone's
+    by_user = {}
+    for b in budgets:
+        by_user.setdefault(b['user_id'], []).append(b)
+    forecasts = {}
+    for uid, user_budgets in by_user.items():
+        forecasts.update(_forecast_user(conn, uid, user_budgets, today))
+    return [forecasts[b['id']] for b in budgets]
+
+def _without_forecast(conn, b):
+    """ Budget with unusable dates: spend summed with plain string bounds, no projection. """
+    limit = b['amount'] or 0
+    spent = conn.execute('''
+        SELECT SUM(COALESCE(base_amount, amount)) FROM expenses
+        WHERE user_id=? AND category=? AND type='Debit' AND date >= ? AND date <= ?
+    ''', (b['user_id'], b['category'], b['start_date'], b['end_date'])).fetchone()[0] or 0
+    return {
+        "id": b['id'],
+        "user_id": b['user_id'],
+        "category": b['category'],
+        "limit": b['amount'],
+        "start_date": b['start_date'],
+        "end_date": b['end_date'],
+        "spent": round(float(spent), 2),
+        "percentage": float(min(100, (spent / limit) * 100)) if limit > 0 else 0,
+        "daily_burn_rate": None,
+        "projected_spend": None,
+        "projected_overrun": None,
+        "overrun_date": None,
+        "active": False,
+    }
+
+def _forecast_user(conn, user_id, budgets, today):
+    """ {budget id: status} for one user's budgets. """
+    result = {}
+    valid, starts, ends = [], [], []
+    window = timedelta(days=MAX_SPAN_DAYS)
+    for b in budgets:
+        s, e = _parse(b['start_date']), _parse(b['end_date'])
+        if s is None or e is None or e < s or s < today - window or e > today + window:
+            result[b['id']] = _without_forecast(conn, b)
+            continue
+        valid.append(b)
+        starts.append(s)
+        ends.append(e)
+    if not valid:
+        return result
+
+    origin, last = min(starts), max(ends)
+    n_days = (last - origin).days + 1
+
+    # 1. Daily spend per budgeted category, one slot per day of the span
+    rows = conn.execute('''
+        SELECT category, substr(date, 1, 10) AS day, SUM(COALESCE(base_amount, amount)) AS total
+        FROM expenses WHERE user_id=? AND type='Debit' AND date >= ? AND date <= ?
+        GROUP BY category, day
+    ''', (user_id, origin.isoformat(), last.isoformat())).fetchall()
+
+    daily = {b['category']: [0.0] * n_days for b in valid}
+    for r in rows:
+        series = daily.get(r['category'])
+        day = _parse(r['day'])
+        # String bounds let through things like '2025-02-30'; those rows are skipped
+        if series is not None and day is not None and origin <= day <= last:
+            series[(day - origin).days] += r['total'] or 0
+    # cum[c][k] = spend in category c on days [0, k)
+    cum = {c: [0.0] + list(accumulate(series)) for c, series in daily.items()}
+
+    t = (today - origin).days
+    for b, s_day, e_day in zip(valid, starts, ends):
+        c = cum[b['category']]
+        start, end = (s_day - origin).days, (e_day - origin).days
+        limit = float(b['amount'] or 0)
+        length = end - start + 1
+
+        # 2. Spend and pace. Days elapsed include today (0 before start, all after end)
+        spent = c[end + 1] - c[start]
+        elapsed = min(max(t - start + 1, 0), length)
+        remaining = length - elapsed
+        to_date = min(start + elapsed, end + 1)
+        spent_to_date = c[to_date] - c[start]
+        avg_rate = spent_to_date / elapsed if elapsed > 0 else 0.0
+        recent_len = min(elapsed, RECENT_DAYS)
+        recent_rate = (c[to_date] - c[to_date - recent_len]) / recent_len if recent_len > 0 else 0.0
+        # Blend the whole-period pace with the last week's so a recent splurge (or a quiet
+        # week) moves the forecast without dominating it
+        rate = 0.5 * avg_rate + 0.5 * recent_rate if elapsed >= RECENT_DAYS else avg_rate
+        projected = spent + rate * remaining
+
+        # 3. Overrun day: first day actual cumulative spend passed the limit, otherwise the
+        # day the projected pace crosses it (if before the budget ends)
+        overrun = None
+        if limit > 0 and spent_to_date > limit:
+            overrun = next(k for k in range(start, to_date) if c[k + 1] - c[start] > limit)
+        elif rate > 0 and projected > limit and limit > 0 and remaining > 0:
+            overrun = start + elapsed - 1 + max(math.ceil((limit - spent) / rate), 1)
+
+        result[b['id']] = {
+            "id": b['id'],
+            "user_id": b['user_id'],
+            "category": b['category'],
+            "limit": b['amount'],
+            "start_date": b['start_date'],
+            "end_date": b['end_date'],
+            "spent": round(spent, 2),
+            "percentage": min(100, (spent / limit) * 100) if limit > 0 else 0,
+            "daily_burn_rate": round(rate, 2),
+            "projected_spend": round(projected, 2),
+            "projected_overrun": round(max(0.0, projected - limit), 2),
+            "overrun_date": (origin + timedelta(days=overrun)).isoformat() if overrun is not None else None,
+            "active": start <= t <= end,
+        }
+    return result
+
+def is_budget_question(message, categories=()):
+    """ True for "will I go over my (food) budget?"-style questions, see BUDGET_QUESTION. """
+    if not isinstance(message, str) or not BUDGET_QUESTION.search(message):
+        return False
+    text = message.lower()
+    return 'budget' in text or any(c and c.lower() in text for c in categories)
+
+def answer_budget_question(forecasts, currency_symbol=None):
+    """ FinBot's reply to "will I blow my budget?" built from the forecasts, no LLM call. """
+    currency_symbol = currency_symbol or fx.currency_symbol()
+    active = [f for f in forecasts if f['active']]
+    if not active:
+        return "📭 You have no active budgets right now. Create one and I'll track your pace!"
+
+    lines = []
+    for f in active:
+        head = (f"{f['category']}: {currency_symbol}{f['spent']:,.0f} of {currency_symbol}{f['limit']:,.0f} spent, "
+                f"on pace for {currency_symbol}{f['projected_spend']:,.0f} by {f['end_date']}")
+        if f['overrun_date'] and f['spent'] > f['limit']:
+            lines.append(f"🚨 {head}. Already over since {f['overrun_date']}.")
+        elif f['overrun_date']:
+            lines.append(f"⚠️ {head}. Likely to cross the limit around {f['overrun_date']} "
+                         f"(over by ~{currency_symbol}{f['projected_overrun']:,.0f}).")
+        else:
+            lines.append(f"✅ {head}. You're on track.")
+    return "\n".join(lines)
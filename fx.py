@@ -0,0 +1,161 @@
+import os
+import sys
+import csv
+import bisect
+import threading
+from datetime import date
+
+from database import iter_shards
+
+# --- FOREIGN EXCHANGE ---
+# Every expense keeps its original amount/currency and gets base_amount, the same value
+# in BASE_CURRENCY, computed when the row is written. Sums (budgets, forecast, dashboard,
+# chat, spike baselines) read base_amount, so nothing converts per row at query time.
+#
+# Rates come from a local CSV of daily rates (date,currency,rate), where rate is the
+# number of BASE_CURRENCY units per one unit of `currency`. A row converts at the latest
+# rate on or before its date (the earliest known rate for older rows). The file is parsed
+# once per process and re-read only when it changes on disk. The bundled fx_rates.csv is
+# a small sample; point FX_RATES_FILE at a real daily export in production.
+#
+# After replacing the rates file or upgrading an old database:
+#   python fx.py backfill          # rows without base_amount
+#   python fx.py backfill --all    # recompute every row
+
+BASE_CURRENCY = os.environ.get('BASE_CURRENCY', 'INR')
+FX_RATES_FILE = os.environ.get('FX_RATES_FILE', 'fx_rates.csv')
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Display only (UI, FinBot replies); anything missing here is shown by its code
+CURRENCY_SYMBOLS = {'INR': '₹', 'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥', 'AED': 'AED ', 'SGD': 'S$'}
+
+_lock = threading.Lock()
+_cache = {"mtime": None, "rates": {}}
+
+def load_rates():
+    """ Returns {currency: (sorted day ordinals, rates)}, cached until the file changes. """
+    try:
+        mtime = os.path.getmtime(FX_RATES_FILE)
+    except OSError:
+        return {}
+    if _cache["mtime"] == mtime:
+        return _cache["rates"]
+
+    with _lock:
+        if _cache["mtime"] == mtime:
+            return _cache["rates"]
+        daily = {}
+        with open(FX_RATES_FILE, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    day = date.fromisoformat(row['date'].strip()).toordinal()
+                    daily.setdefault(row['currency'].strip().upper(), {})[day] = float(row['rate'])
+                except (KeyError, ValueError, AttributeError):
+                    continue
+        rates = {}
+        for currency, by_day in daily.items():
+            days = sorted(by_day)
+            rates[currency] = (days, [by_day[d] for d in days])
+        _cache["rates"], _cache["mtime"] = rates, mtime
+        return rates
+
+def currencies():
+    """ Currencies the form can offer: the base currency plus everything with a rate. """
+    return [BASE_CURRENCY] + sorted(c for c in load_rates() if c != BASE_CURRENCY)
+
+def normalize_currency(currency):
+    return (currency or BASE_CURRENCY).strip().upper() or BASE_CURRENCY
+
+def currency_symbol(currency=None):
+    currency = normalize_currency(currency)
+    return CURRENCY_SYMBOLS.get(currency, currency + ' ')
+
+def rate_on(currency, day):
+    """ BASE_CURRENCY per unit of `currency` on `day` (ISO string or date), or None if unknown. """
+    currency = normalize_currency(currency)
+    if currency == BASE_CURRENCY:
+        return 1.0
+    found = load_rates().get(currency)
+    if not found:
+        return None
+    days, values = found
+    try:
+        ordinal = (day if isinstance(day, date) else date.fromisoformat(str(day)[:10])).toordinal()
+    except ValueError:
+        ordinal = date.today().toordinal()
+    i = bisect.bisect_right(days, ordinal) - 1
+    return values[max(i, 0)]
+
+def to_base(amount, currency, day):
+    """ base_amount for one row; None when the amount or the rate is missing. """
+    if amount is None:
+        return None
+    rate = rate_on(currency, day)
+    if rate is None:
+        return None
+    return round(float(amount) * rate, 2)
+
+# --- BULK BACKFILL ---
+
+def rates_frame():
+    import pandas as pd
+
+    records = [(c, d, r) for c, (days, values) in load_rates().items() for d, r in zip(days, values)]
+    return pd.DataFrame(records, columns=['currency', 'ordinal', 'rate']).sort_values('ordinal')
+
+def backfill(conn, only_missing=True):
+    """
+    Recomputes base_amount for a whole shard with one as-of join (pandas merge_asof)
+    instead of a rate lookup per row. Returns (updated, unconverted).
+    """
+    import numpy as np
+    import pandas as pd
+
+    # Currency normalized in SQL, cheaper than pandas string ops on every row
+    query = '''SELECT id, substr(date, 1, 10) AS day, amount,
+               COALESCE(NULLIF(UPPER(TRIM(currency)), ''), ?) AS currency FROM expenses'''
+    if only_missing:
+        query += ' WHERE base_amount IS NULL'
+    df = pd.read_sql_query(query, conn, params=(BASE_CURRENCY,))
+    if df.empty:
+        return 0, 0
+
+    # Same day numbering as date.toordinal(), so it lines up with the cached rates
+    day = pd.to_datetime(df['day'], format='%Y-%m-%d', errors='coerce').fillna(pd.Timestamp(date.today()))
+    df['ordinal'] = day.to_numpy().astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+
+    rates = rates_frame()
+    df = df.sort_values('ordinal')
+    if rates.empty:
+        df['rate'] = np.nan
+    else:
+        rates['ordinal'] = rates['ordinal'].astype(np.int64)
+        # Latest rate on or before the row's date, else the earliest rate after it
+        df = pd.merge_asof(df, rates, on='ordinal', by='currency', direction='backward')
+        missing = df['rate'].isna()
+        if missing.any():
+            forward = pd.merge_asof(df.loc[missing, ['id', 'ordinal', 'currency']], rates,
+                                    on='ordinal', by='currency', direction='forward')
+            df.loc[missing, 'rate'] = forward['rate'].to_numpy()
+    df.loc[df['currency'] == BASE_CURRENCY, 'rate'] = 1.0
+
+    # Write back in id order: sequential B-tree pages instead of random ones
+    df = df.sort_values('id')
+    base = (df['amount'] * df['rate']).round(2)
+    converted = base.notna()
+    conn.executemany('UPDATE expenses SET base_amount=? WHERE id=?',
+                     zip(base[converted].tolist(), df.loc[converted, 'id'].tolist()))
+    conn.commit()
+    return int(converted.sum()), int((~converted).sum())
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'backfill':
+        sys.exit("Usage: python fx.py backfill [--all]")
+    only_missing = '--all' not in sys.argv
+    updated = unconverted = 0
+    for name, conn in iter_shards():
+        u, n = backfill(conn, only_missing)
+        updated, unconverted = updated + u, unconverted + n
+    print(f"💱 Converted {updated} transactions to {BASE_CURRENCY}"
+          + (f", {unconverted} left without a rate." if unconverted else "."))
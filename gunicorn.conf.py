@@ -0,0 +1,35 @@
+import gc
+import os
+
+# --- GUNICORN CONFIGURATION ---
+# Run with: gunicorn -c gunicorn.conf.py app:app
+#
+# Startup modes:
+#   default                   -> lazy: heavy libs (pandas, cv2, groq...) load on first
+#                                use of /api/export, /api/upload or /api/chat per worker.
+#   PRELOAD_HEAVY_MODULES=1   -> preload: the master imports the app and every heavy
+#                                lib once, then forks workers that share them copy-on-write.
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+
+# Threaded workers: while OCR/LLM requests wait in their admission pools
+# (admission.py), the remaining threads keep serving the CRUD endpoints. app.py sizes
+# the pools from this same GUNICORN_THREADS so that at least CRUD_RESERVED_THREADS
+# (default: 3/8, min 2) are never held by uploads or chat, queued or running.
+# Per worker with the default 8 threads: 3 CRUD, upload 1 running + 1 queued,
+# chat 2 running + 1 queued; anything beyond that gets a 429 with Retry-After.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+
+# Follows PRELOAD_HEAVY_MODULES unless GUNICORN_PRELOAD says otherwise (bench_startup.py
+# uses GUNICORN_PRELOAD=0 for workers that each import the heavy libs themselves)
+preload_app = os.environ.get('GUNICORN_PRELOAD', os.environ.get('PRELOAD_HEAVY_MODULES', '0')) == '1'
+
+def when_ready(server):
+    # Runs in the master before workers are forked. Moving everything allocated so far
+    # into the permanent generation stops the GC from touching (and so copying) the
+    # shared pages in each worker.
+    if preload_app:
+        gc.freeze()
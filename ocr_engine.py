@@ -1,16 +1,132 @@
+import os
 import cv2
+import queue
+import threading
 import pytesseract
 import numpy as np
 from PIL import Image
 import re
 import imagehash
+from contextlib import contextmanager
 from datetime import datetime
 from dateutil import parser
 
+# tesserocr binds the Tesseract C API directly, so an engine (and its language data)
+# stays loaded between receipts. Without it we fall back to pytesseract, which spawns
+# a tesseract process per call.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
 # --- TESSERACT CONFIGURATION ---
 # If you uncommented this in test_setup.py, UNCOMMENT IT HERE TOO:
 # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
+OCR_LANG = os.environ.get('OCR_LANG', 'eng')
+OCR_POOL_SIZE = int(os.environ.get('OCR_POOL_SIZE', '2'))
+# 'full' OCRs the whole receipt, 'regions' only the header and totals blocks
+OCR_MODE = os.environ.get('OCR_MODE', 'full')
+
+# Share of the receipt's text span treated as header (merchant/date) and totals
+HEADER_FRACTION = 0.3
+TOTALS_FRACTION = 0.35
+
+class TesseractPool:
+    """
+    A small pool of long-lived Tesseract engines reused across requests.
+    Engines are created on demand up to `size`; callers block until one is free.
+    """
+    def __init__(self, size=OCR_POOL_SIZE, lang=OCR_LANG):
+        self.size = size
+        self.lang = lang
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_engine(self):
+        return tesserocr.PyTessBaseAPI(lang=self.lang, oem=tesserocr.OEM.DEFAULT)
+
+    @contextmanager
+    def engine(self):
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._created < self.size
+                if grow:
+                    self._created += 1
+            if grow:
+                try:
+                    api = self._new_engine()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                api = self._idle.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self._idle.put(api)
+
+    def warm(self):
+        """ Creates the first engine now, so a broken setup (e.g. no tessdata) shows up here. """
+        with self.engine():
+            pass
+
+    def recognize(self, img, psm=6):
+        with self.engine() as api:
+            api.SetPageSegMode(psm)
+            api.SetImage(Image.fromarray(img))
+            return api.GetUTF8Text()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().End()
+            except queue.Empty:
+                break
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_ocr_pool():
+    """
+    Returns this process's engine pool (engines are never shared across a fork), or None
+    when tesserocr is missing or can't start an engine; callers then use pytesseract.
+    """
+    global _pool, _pool_pid
+    if tesserocr is None:
+        return None
+    pid = os.getpid()
+    if _pool_pid != pid:
+        # gthread workers: two first requests must not each build a pool
+        with _pool_lock:
+            if _pool_pid != pid:
+                pool = TesseractPool()
+                try:
+                    pool.warm()
+                except RuntimeError as e:
+                    # tesserocr looks for tessdata at its compiled-in path, which may differ
+                    # from the tesseract CLI's; don't fail every upload over it
+                    print(f"⚠️ tesserocr unavailable ({e}), using pytesseract")
+                    pool = None
+                _pool, _pool_pid = pool, pid
+    return _pool
+
+def run_ocr(img, psm=6, use_pool=True):
+    """
+    OCRs a numpy image with a pooled engine when available, otherwise via pytesseract.
+    --oem 3: Default engine mode, --psm 6: Assume a single uniform block of text
+    """
+    pool = get_ocr_pool() if use_pool else None
+    if pool is not None:
+        return pool.recognize(img, psm=psm)
+    return pytesseract.image_to_string(img, config=f'--oem 3 --psm {psm}')
+
 def preprocess_image(image_path):
     """
     Reads image, converts to grayscale, applies thresholding for better OCR.
@@ -23,15 +139,72 @@ def preprocess_image(image_path):
     
     return gray, thresh
 
-def extract_text(image_path):
+def find_text_blocks(thresh):
+    """
+    Layout pass: smears characters into lines/blocks and returns their bounding boxes
+    (x, y, w, h) top to bottom. Specks, rules and solid graphics (logos, barcodes) are dropped.
+    """
+    h, w = thresh.shape[:2]
+    ink = cv2.bitwise_not(thresh)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, w // 40), max(3, h // 200)))
+    smeared = cv2.dilate(ink, kernel, iterations=1)
+    contours, _ = cv2.findContours(smeared, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    blocks = []
+    for cnt in contours:
+        x, y, bw, bh = cv2.boundingRect(cnt)
+        if bw < 10 or bh < 6:
+            continue
+        density = cv2.countNonZero(ink[y:y + bh, x:x + bw]) / float(bw * bh)
+        if density > 0.6:
+            continue
+        blocks.append((x, y, bw, bh))
+    return sorted(blocks, key=lambda b: (b[1], b[0]))
+
+def select_key_regions(blocks, pad=8):
+    """
+    Picks the header (merchant/date) and totals bands from the text blocks.
+    Returns a list of (x0, y0, x1, y1) crops, or None when the whole receipt should be read.
+    """
+    if not blocks:
+        return None
+    top = min(b[1] for b in blocks)
+    bottom = max(b[1] + b[3] for b in blocks)
+    span = bottom - top
+    header_end = top + span * HEADER_FRACTION
+    totals_start = bottom - span * TOTALS_FRACTION
+
+    header = [b for b in blocks if b[1] < header_end]
+    totals = [b for b in blocks if b[1] + b[3] > totals_start and b not in header]
+    # Short receipts: the two bands already cover everything, one pass is cheaper
+    if len(header) + len(totals) >= len(blocks):
+        return None
+
+    regions = []
+    for band in (header, totals):
+        if band:
+            regions.append((min(b[0] for b in band) - pad, min(b[1] for b in band) - pad,
+                            max(b[0] + b[2] for b in band) + pad, max(b[1] + b[3] for b in band) + pad))
+    return regions
+
+def extract_text(image_path, mode=None, use_pool=True):
     """
     Uses Tesseract to extract raw text from the processed image.
+    mode='regions' only reads the header and totals bands found by the layout pass.
     """
     gray, thresh = preprocess_image(image_path)
-    # --oem 3: Default engine mode, --psm 6: Assume a single uniform block of text
-    custom_config = r'--oem 3 --psm 6' 
-    text = pytesseract.image_to_string(thresh, config=custom_config)
-    return text
+    mode = mode or OCR_MODE
+
+    regions = select_key_regions(find_text_blocks(thresh)) if mode == 'regions' else None
+    if not regions:
+        return run_ocr(thresh, psm=6, use_pool=use_pool)
+
+    h, w = thresh.shape[:2]
+    parts = []
+    for x0, y0, x1, y1 in regions:
+        crop = thresh[max(0, y0):min(h, y1), max(0, x0):min(w, x1)]
+        parts.append(run_ocr(crop, psm=6, use_pool=use_pool))
+    return '\n'.join(parts)
 
 def parse_receipt_data(text):
     """
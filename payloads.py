@@ -0,0 +1,129 @@
+import os
+import json
+import zlib
+
+from flask import Response
+
+# brotli compresses JSON noticeably better than gzip at similar speed (in requirements);
+# gzip (zlib, always available) is used when it's missing or the client doesn't accept br.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- COMPACT JSON RESPONSES ---
+# Large result sets are streamed straight from the cursor in blocks of BLOCK_ROWS rows,
+# JSON-encoded and compressed on the fly, so the full list never sits in memory.
+#
+# Default: the usual array of row objects.
+# Columnar (?format=columnar or Accept: COLUMNAR_MIME): column arrays per block, with
+# repetitive text columns dictionary-encoded (integer index into a per-column list):
+#   {"format": "columnar",
+#    "columns": ["id", "date", "merchant", ...],
+#    "blocks": [[[ids...], [dates...], [merchant indexes...], ...], ...],
+#    "dictionaries": {"merchant": ["Zomato", "Uber", ...], ...},
+#    "count": 100000}
+# Dictionaries come last because they're only complete after the final block.
+# decodeColumnar() in static/js/script.js turns this back into row objects.
+
+COLUMNAR_MIME = 'application/vnd.expenses.columnar+json'
+DICTIONARY_COLUMNS = ('category', 'merchant', 'payment_mode', 'type', 'currency', 'source')
+
+BLOCK_ROWS = int(os.environ.get('PAYLOAD_BLOCK_ROWS', '2000'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Writes below this are batched before compressing/sending
+CHUNK_BYTES = 64 * 1024
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+def wants_columnar(request):
+    return request.args.get('format') == 'columnar' or COLUMNAR_MIME in request.headers.get('Accept', '')
+
+def pick_encoding(request):
+    offered = ['br', 'gzip'] if brotli else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+def iter_rows(cursor):
+    """ [{"col": value, ...}, ...] one block at a time. """
+    names = [d[0] for d in cursor.description]
+    yield '['
+    first = True
+    while True:
+        rows = cursor.fetchmany(BLOCK_ROWS)
+        if not rows:
+            break
+        block = ','.join(_dumps(dict(zip(names, row))) for row in rows)
+        yield block if first else ',' + block
+        first = False
+    yield ']'
+
+def iter_columnar(cursor, dictionary_columns=DICTIONARY_COLUMNS):
+    names = [d[0] for d in cursor.description]
+    encoded = {i: {} for i, name in enumerate(names) if name in dictionary_columns}
+    yield '{"format":"columnar","columns":' + _dumps(names) + ',"blocks":['
+    count = 0
+    while True:
+        rows = cursor.fetchmany(BLOCK_ROWS)
+        if not rows:
+            break
+        columns = [list(col) for col in zip(*rows)]
+        for i, index in encoded.items():
+            columns[i] = [None if v is None else index.setdefault(v, len(index)) for v in columns[i]]
+        yield (',' if count else '') + _dumps(columns)
+        count += len(rows)
+    dictionaries = {names[i]: list(index) for i, index in encoded.items()}
+    yield '],"dictionaries":' + _dumps(dictionaries) + ',"count":' + str(count) + '}'
+
+def _batched(chunks, size=CHUNK_BYTES):
+    """ Joins small text chunks into ~size-byte UTF-8 writes. """
+    buf, buffered = [], 0
+    for chunk in chunks:
+        buf.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buf).encode('utf-8')
+            buf, buffered = [], 0
+    if buf:
+        yield ''.join(buf).encode('utf-8')
+
+def compress(chunks, encoding):
+    """ Streams byte chunks through gzip or brotli (or passes them through). """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            out = compressor.process(chunk)
+            if out:
+                yield out
+        yield compressor.finish()
+    elif encoding == 'gzip':
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+    else:
+        yield from chunks
+
+def stream_json(cursor, columnar=False, encoding=None):
+    """ Encoded body of a query result, as byte chunks. """
+    chunks = iter_columnar(cursor) if columnar else iter_rows(cursor)
+    return compress(_batched(chunks), encoding)
+
+def query_response(conn, cursor, request):
+    """
+    Streaming Response for a query result, in the format/encoding the client asked for.
+    `conn` is closed when the response is, even if the body is never iterated
+    (client gone, HEAD request, error before the first chunk).
+    """
+    columnar = wants_columnar(request)
+    encoding = pick_encoding(request)
+    response = Response(stream_json(cursor, columnar, encoding),
+                        mimetype=COLUMNAR_MIME if columnar else 'application/json')
+    response.call_on_close(conn.close)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
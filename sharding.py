@@ -0,0 +1,149 @@
+import re
+import sys
+import json
+
+from database import (DB_NAME, MAIN_SHARD, SHARD_COUNT, USER_TABLES, connect_shard, get_db_connection,
+                      iter_shards, query_all_shards, shard_for_user, shard_names)
+
+# --- SHARD ADMINISTRATION ---
+#   python sharding.py status
+#   python sharding.py move <user_id> <shard>
+#   python sharding.py migrate              # users still in 'main' -> their hashed shard
+#   python sharding.py query "<SELECT ...>" # read query across every shard
+
+# "Possible duplicate of ID 12" (flagging.py), "Duplicate of ID 12" (receipt upload)
+ID_REFERENCE = re.compile(r'(of ID )(\d+)')
+
+def _columns(conn, table, schema='main'):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+def _copy_rows(src, dst, table, user_id, schema='main'):
+    """ Copies one user's rows; id tables get new ids from dst's range. Returns (rows, {old: new}). """
+    dst_cols = set(_columns(dst, table, schema))
+    cols = [c for c in _columns(src, table) if c in dst_cols and c != 'id']
+    col_list = ', '.join(cols)
+    has_id = 'id' in dst_cols
+    rows = src.execute(f'SELECT {"id, " if has_id else ""}{col_list} FROM main.{table} WHERE user_id=?'
+                       f'{" ORDER BY id" if has_id else ""}', (user_id,)).fetchall()
+    insert = f'INSERT INTO {schema}.{table} ({col_list}) VALUES ({", ".join(["?"] * len(cols))})'
+    if not has_id:
+        dst.executemany(insert, [tuple(r) for r in rows])
+        return len(rows), {}
+    new_ids = {}
+    for row in rows:
+        new_ids[row['id']] = dst.execute(insert, tuple(row)[1:]).lastrowid
+    return len(rows), new_ids
+
+def move_user(user_id, target):
+    """
+    Moves one user's rows to `target` while the app keeps running. Returns rows copied.
+
+    1. BEGIN IMMEDIATE on the source: the user's writers wait, readers carry on.
+    2. Copy every user table to the target and commit there. Expenses and budgets get
+       new ids from the target's range (see SHARD_ID_STRIDE); flag reasons that cite an
+       expense id are rewritten to match. Plain INSERTs: a collision fails the move
+       instead of overwriting another user's row.
+    3. In the source transaction: repoint the directory, delete the rows and leave a
+       moved_users tombstone, then commit. Directory and source commit together.
+    Requests that routed to the source before step 3 hit the tombstone trigger and fail
+    instead of writing rows nobody will read. Re-running after a crash is safe.
+    """
+    if target not in shard_names():
+        raise ValueError(f"Unknown shard '{target}'")
+    source = shard_for_user(user_id)
+    if source == target:
+        return 0
+
+    src = connect_shard(source)
+    # BEGIN IMMEDIATE also reserves the attached directory, which *is* the main shard:
+    # a move to main writes through the source connection, in the same transaction
+    if target == MAIN_SHARD:
+        dst, schema = src, 'directory'
+    else:
+        dst, schema = connect_shard(target), 'main'
+    copied = 0
+    try:
+        src.execute('BEGIN IMMEDIATE')
+        # A tombstone from an earlier move off the target would reject the copy
+        dst.execute(f'DELETE FROM {schema}.moved_users WHERE user_id=?', (user_id,))
+        for table in USER_TABLES:
+            # Leftovers of an earlier attempt that crashed before the source commit
+            dst.execute(f'DELETE FROM {schema}.{table} WHERE user_id=?', (user_id,))
+        renumbered = {}
+        for table in USER_TABLES:
+            count, renumbered[table] = _copy_rows(src, dst, table, user_id, schema)
+            copied += count
+        expense_ids = renumbered['expenses']
+        remap = lambda m: m.group(1) + str(expense_ids.get(int(m.group(2)), m.group(2)))
+        for row in dst.execute(f"SELECT id, flag_reason FROM {schema}.expenses WHERE user_id=? AND flag_reason LIKE '%of ID %'",
+                               (user_id,)).fetchall():
+            dst.execute(f'UPDATE {schema}.expenses SET flag_reason=? WHERE id=?',
+                        (ID_REFERENCE.sub(remap, row['flag_reason']), row['id']))
+        if dst is not src:
+            dst.commit()
+
+        # user_shards resolves to the directory whether the source is 'main' or an attached shard
+        src.execute('INSERT OR REPLACE INTO user_shards (user_id, shard) VALUES (?, ?)', (user_id, target))
+        for table in USER_TABLES:
+            src.execute(f'DELETE FROM main.{table} WHERE user_id=?', (user_id,))
+        src.execute('INSERT OR IGNORE INTO main.moved_users (user_id) VALUES (?)', (user_id,))
+        src.commit()
+    except Exception:
+        dst.rollback()
+        src.rollback()
+        raise
+    finally:
+        src.close()
+        if dst is not src:
+            dst.close()
+    return copied
+
+def hashed_shard(user_id):
+    return f'shard_{int(user_id) % SHARD_COUNT:02d}'
+
+def migrate_main():
+    """ Moves every user still on the main shard to their hashed shard. """
+    if SHARD_COUNT <= 0:
+        return 0
+    conn = get_db_connection()
+    users = [r['id'] for r in conn.execute('''
+        SELECT id FROM users WHERE id NOT IN (SELECT user_id FROM user_shards)''').fetchall()]
+    conn.close()
+    for user_id in users:
+        move_user(user_id, hashed_shard(user_id))
+    return len(users)
+
+def shard_status():
+    conn = get_db_connection()
+    assigned = {r['shard']: r['n'] for r in conn.execute(
+        'SELECT shard, COUNT(*) AS n FROM user_shards GROUP BY shard').fetchall()}
+    unassigned = conn.execute(
+        'SELECT COUNT(*) FROM users WHERE id NOT IN (SELECT user_id FROM user_shards)').fetchone()[0]
+    conn.close()
+
+    status = []
+    for name, shard in iter_shards():
+        status.append({
+            "shard": name,
+            "users": unassigned if name == MAIN_SHARD else assigned.get(name, 0),
+            "expenses": shard.execute('SELECT COUNT(*) FROM main.expenses').fetchone()[0],
+            "budgets": shard.execute('SELECT COUNT(*) FROM main.budgets').fetchone()[0],
+        })
+    return status
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if cmd == 'status':
+        print(f"🗂️  Directory: {DB_NAME}, {SHARD_COUNT} shards configured")
+        for s in shard_status():
+            print(f"   {s['shard']:<10} users: {s['users']:>6}   expenses: {s['expenses']:>9}   budgets: {s['budgets']:>6}")
+    elif cmd == 'move' and len(sys.argv) == 4:
+        n = move_user(int(sys.argv[2]), sys.argv[3])
+        print(f"✅ Moved user {sys.argv[2]} to {sys.argv[3]} ({n} rows).")
+    elif cmd == 'migrate':
+        print(f"✅ Moved {migrate_main()} users off the main shard.")
+    elif cmd == 'query' and len(sys.argv) == 3:
+        for row in query_all_shards(sys.argv[2]):
+            print(json.dumps(row, default=str))
+    else:
+        sys.exit('Usage: python sharding.py status | move <user_id> <shard> | migrate | query "<sql>"')
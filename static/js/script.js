@@ -1,6 +1,9 @@
 let allExpenses = [];
 let expenseChart = null;
 
+// Totals use base_amount (the amount in BASE_CURRENCY, set by the server); older rows may not have it yet
+const baseAmount = ex => ex.base_amount ?? ex.amount;
+
 document.addEventListener("DOMContentLoaded", () => {
     const d = document.getElementById('date');
     if(d) d.valueAsDate = new Date();
@@ -58,17 +61,33 @@ async function loadExpenses() {
     }
 
     // Build Query URL
-    let url = `/api/expenses?t=${new Date().getTime()}`; 
+    let url = `/api/expenses?format=columnar&t=${new Date().getTime()}`; 
     if(selectedMonths.length > 0) {
         url += `&months=${selectedMonths.join(',')}`;
     }
     if(search) url += `&search=${encodeURIComponent(search)}`;
 
     const res = await fetch(url);
-    allExpenses = await res.json();
+    allExpenses = decodeColumnar(await res.json());
     updateDashboard();
 }
 
+// Columnar payload (see payloads.py) -> array of row objects
+function decodeColumnar(payload) {
+    const rows = [];
+    const dicts = payload.dictionaries;
+    const decoders = payload.columns.map(c => dicts[c] ? (v => v === null ? null : dicts[c][v]) : (v => v));
+    payload.blocks.forEach(block => {
+        const n = block[0].length;
+        for(let i = 0; i < n; i++) {
+            const row = {};
+            payload.columns.forEach((c, j) => { row[c] = decoders[j](block[j][i]); });
+            rows.push(row);
+        }
+    });
+    return rows;
+}
+
 function updateDashboard() {
     let income = 0, expense = 0;
     const tbody = document.querySelector('#expense-table tbody');
@@ -79,20 +98,23 @@ function updateDashboard() {
     }
 
     allExpenses.forEach(ex => {
-        if(ex.type === 'Credit') income += ex.amount; else expense += ex.amount;
+        const base = baseAmount(ex);
+        if(ex.type === 'Credit') income += base; else expense += base;
+        const foreign = ex.currency && typeof BASE_CURRENCY !== 'undefined' && ex.currency !== BASE_CURRENCY;
         
         const row = `
         <tr class="hover:bg-slate-50 transition group border-b border-slate-50 last:border-none">
             <td class="p-4 pl-6 text-slate-500">${ex.date}</td>
             <td class="p-4">
-                <div class="font-bold text-slate-700">${ex.merchant}</div>
+                <div class="font-bold text-slate-700">${ex.merchant}${ex.is_flagged ? ` <span class="text-rose-500 cursor-help" title="${ex.flag_reason || 'Flagged'}">🚩</span>` : ''}</div>
                 <div class="text-xs text-slate-400 mt-0.5 flex gap-2">
                     <span class="bg-slate-100 px-2 py-0.5 rounded text-slate-500">${ex.category}</span>
                     <span class="text-indigo-400">${ex.payment_mode}</span>
                 </div>
             </td>
             <td class="p-4 font-bold ${ex.type==='Credit'?'text-emerald-500':'text-rose-500'}">
-                ${ex.type==='Credit'?'+':'-'} ₹${ex.amount}
+                ${ex.type==='Credit'?'+':'-'} ${foreign ? `${ex.currency} ${ex.amount}` : `${BASE_SYMBOL}${ex.amount}`}
+                ${foreign ? `<div class="text-xs text-slate-400 font-medium">≈ ${BASE_SYMBOL}${base.toFixed(2)}</div>` : ''}
             </td>
             <td class="p-4 pr-6 text-right opacity-0 group-hover:opacity-100 transition-opacity duration-200">
                 <button onclick="openEditModal(${ex.id})" class="text-amber-500 hover:bg-amber-50 p-2 rounded-lg transition mr-1">✎</button>
@@ -102,9 +124,9 @@ function updateDashboard() {
         tbody.innerHTML += row;
     });
 
-    document.getElementById('kpi-income').innerText = `₹${income.toFixed(2)}`;
-    document.getElementById('kpi-expense').innerText = `₹${expense.toFixed(2)}`;
-    document.getElementById('kpi-balance').innerText = `₹${(income - expense).toFixed(2)}`;
+    document.getElementById('kpi-income').innerText = `${BASE_SYMBOL}${income.toFixed(2)}`;
+    document.getElementById('kpi-expense').innerText = `${BASE_SYMBOL}${expense.toFixed(2)}`;
+    document.getElementById('kpi-balance').innerText = `${BASE_SYMBOL}${(income - expense).toFixed(2)}`;
     
     renderChart(allExpenses);
 }
@@ -135,7 +157,7 @@ function renderChart(data) {
                 key = item.date;
             }
             if(!grouped[key]) grouped[key] = 0;
-            grouped[key] += item.amount;
+            grouped[key] += baseAmount(item);
         }
     });
 
@@ -193,14 +215,20 @@ async function uploadImage() {
     
     const res = await fetch('/api/upload', { method:'POST', body:formData });
     const data = await res.json();
+    if(res.status === 429) {
+        document.getElementById('scan-status').innerText = `⏳ ${data.error} (retry in ${data.retry_after}s)`;
+        return;
+    }
     document.getElementById('scan-status').innerText = "";
 
     document.getElementById('v-preview').src = data.image_url;
     document.getElementById('v-merchant').value = data.merchant;
     document.getElementById('v-date').value = data.date;
     document.getElementById('v-amount').value = data.amount;
+    document.getElementById('v-currency').value = data.currency || BASE_CURRENCY;
     document.getElementById('v-category').value = data.category;
     document.getElementById('v-hash').value = data.image_hash;
+    document.getElementById('v-key').value = data.image_key;
     document.getElementById('v-flagged').value = data.is_flagged;
     
     openModal('verify-modal');
@@ -211,9 +239,11 @@ async function saveVerified() {
         merchant: document.getElementById('v-merchant').value,
         date: document.getElementById('v-date').value,
         amount: parseFloat(document.getElementById('v-amount').value),
+        currency: document.getElementById('v-currency').value,
         category: document.getElementById('v-category').value,
         type: 'Debit', source: 'scanned', payment_mode: 'Cash',
         image_hash: document.getElementById('v-hash').value,
+        image_key: document.getElementById('v-key').value,
         is_flagged: document.getElementById('v-flagged').value
     };
     await fetch('/api/expenses', { method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify(data) });
@@ -239,6 +269,13 @@ async function loadBudgets() {
         if(b.percentage > 75) color = 'bg-amber-500';
         if(b.percentage > 90) color = 'bg-rose-500';
 
+        let forecast = '';
+        if(b.active) {
+            forecast = b.overrun_date
+                ? `<p class="text-[10px] text-rose-500 font-medium mt-1">📈 On pace for ${BASE_SYMBOL}${b.projected_spend} · limit crossed ~${b.overrun_date}</p>`
+                : `<p class="text-[10px] text-slate-400 font-medium mt-1">📈 On pace for ${BASE_SYMBOL}${b.projected_spend}</p>`;
+        }
+
         const dateRange = `${new Date(b.start_date).toLocaleDateString('en-GB', {day:'numeric', month:'short'})} - ${new Date(b.end_date).toLocaleDateString('en-GB', {day:'numeric', month:'short'})}`;
 
         const html = `
@@ -249,7 +286,7 @@ async function loadBudgets() {
                         <span class="text-[10px] text-slate-400 font-medium">${dateRange}</span>
                     </div>
                     <div class="flex items-center gap-2">
-                        <span class="text-slate-500 text-xs">₹${b.spent} / ₹${b.limit}</span>
+                        <span class="text-slate-500 text-xs">${BASE_SYMBOL}${b.spent} / ${BASE_SYMBOL}${b.limit}</span>
                         <button onclick='editBudget(${JSON.stringify(b)})' class="text-xs text-indigo-500 hover:bg-indigo-50 p-1 rounded">✎</button>
                         <button onclick='deleteBudget(${b.id})' class="text-xs text-rose-500 hover:bg-rose-50 p-1 rounded">✕</button>
                     </div>
@@ -257,6 +294,7 @@ async function loadBudgets() {
                 <div class="w-full bg-slate-100 rounded-full h-2.5 overflow-hidden">
                     <div class="${color} h-2.5 rounded-full transition-all duration-1000" style="width: ${b.percentage}%"></div>
                 </div>
+                ${forecast}
             </div>`;
         container.innerHTML += html;
     });
@@ -400,7 +438,8 @@ async function sendMessage() {
 
     const res = await fetch('/api/chat', { method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({message:msg}) });
     const data = await res.json();
+    const reply = res.status === 429 ? `⏳ ${data.error} (retry in ${data.retry_after}s)` : data.response;
     
-    box.innerHTML += `<div class="bg-white border border-slate-200 text-slate-700 p-3 rounded-2xl rounded-bl-none self-start max-w-xs text-sm shadow-sm">${data.response}</div>`;
+    box.innerHTML += `<div class="bg-white border border-slate-200 text-slate-700 p-3 rounded-2xl rounded-bl-none self-start max-w-xs text-sm shadow-sm">${reply}</div>`;
     box.scrollTop = box.scrollHeight;
 }
\ No newline at end of file
@@ -0,0 +1,251 @@
+import os
+import sys
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from database import get_db_connection, iter_shards
+
+# --- RECEIPT IMAGE STORAGE ---
+# Images are stored once per unique content under media/<aa>/<bb>/<sha256>, no matter
+# how many users upload them or what the file was called. Users get a row in
+# image_refs per image they uploaded, and URLs are keyed by the hash, so the bytes
+# behind a URL never change and browsers can cache them forever.
+
+MEDIA_FOLDER = os.environ.get('MEDIA_FOLDER', 'media')
+
+# name -> (max width/height, format, quality)
+DERIVATIVES = {
+    'thumb': ((320, 320), 'WEBP', 70),
+    'preview': ((1280, 1280), 'WEBP', 80),
+}
+DERIVATIVE_MIME = 'image/webp'
+
+# Uploads that never got saved as an expense are collected after this long
+ORPHAN_GRACE = timedelta(hours=24)
+
+# What PIL detects in the bytes decides the stored (and served) type, never the client
+IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF', 'BMP', 'TIFF')
+
+class UnsupportedImage(ValueError):
+    pass
+
+CHUNK_SIZE = 64 * 1024
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _background():
+    """ Single background thread per process for derivative generation. """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='media')
+            _executor_pid = os.getpid()
+        return _executor
+
+def is_valid_digest(digest):
+    return len(digest) == 64 and all(ch in '0123456789abcdef' for ch in digest)
+
+def object_path(digest, variant='original'):
+    """ media/ab/cd/abcd...  (derivatives: abcd....thumb.webp) """
+    name = digest if variant == 'original' else f"{digest}.{variant}.webp"
+    return os.path.join(MEDIA_FOLDER, digest[:2], digest[2:4], name)
+
+def detect_mime(path):
+    """ MIME type of an image file from its content; raises UnsupportedImage otherwise. """
+    try:
+        with Image.open(path) as img:
+            fmt = img.format
+            img.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise UnsupportedImage("File is not a supported image")
+    if fmt not in IMAGE_FORMATS:
+        raise UnsupportedImage(f"Unsupported image format: {fmt}")
+    return Image.MIME[fmt]
+
+def store_upload(file, user_id):
+    """
+    Streams an uploaded file to disk while hashing it, keeps a single copy per
+    content hash and records the user's reference. Returns the digest; raises
+    UnsupportedImage (nothing stored) if the bytes aren't an image.
+    """
+    os.makedirs(MEDIA_FOLDER, exist_ok=True)
+    sha = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=MEDIA_FOLDER, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        mime = detect_mime(tmp_path)
+        digest = sha.hexdigest()
+
+        now = datetime.utcnow().isoformat(timespec='seconds')
+        # The user's shard; images lives in the directory DB, reachable through the same connection.
+        # Re-uploading refreshes both created_at values so the GC grace period starts over;
+        # the row is written before the file is put in place (see gc_orphans)
+        conn = get_db_connection(user_id)
+        try:
+            conn.execute('''INSERT INTO images (digest, mime, size, created_at) VALUES (?, ?, ?, ?)
+                            ON CONFLICT(digest) DO UPDATE SET mime=excluded.mime, created_at=excluded.created_at''',
+                         (digest, mime, size, now))
+            conn.execute('''INSERT INTO image_refs (user_id, digest, original_name, created_at) VALUES (?, ?, ?, ?)
+                            ON CONFLICT(user_id, digest) DO UPDATE SET created_at=excluded.created_at''',
+                         (user_id, digest, file.filename, now))
+            conn.commit()
+        finally:
+            conn.close()
+
+        # Always replaced (same bytes, atomic): a concurrent GC may have just removed it
+        path = object_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _background().submit(generate_derivatives, digest)
+    return digest
+
+def generate_derivative(digest, variant):
+    """ Writes one resized WebP derivative (atomically) and returns its path. """
+    target = object_path(digest, variant)
+    if os.path.exists(target):
+        return target
+    max_size, fmt, quality = DERIVATIVES[variant]
+    with Image.open(object_path(digest)) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(max_size)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        img.save(tmp, fmt, quality=quality, method=4)
+    os.replace(tmp, target)
+    return target
+
+def generate_derivatives(digest):
+    for variant in DERIVATIVES:
+        try:
+            generate_derivative(digest, variant)
+        except Exception as e:
+            print(f"⚠️ Derivative {variant} for {digest[:12]} failed: {e}")
+
+def user_has_image(user_id, digest):
+    conn = get_db_connection(user_id)
+    row = conn.execute('SELECT 1 FROM image_refs WHERE user_id=? AND digest=?', (user_id, digest)).fetchone()
+    conn.close()
+    return row is not None
+
+def resolve(digest, variant='original'):
+    """
+    Returns (path, mime) for a stored image, or None. Missing derivatives are built
+    inline so the immutable URL always serves the right bytes.
+    """
+    if not is_valid_digest(digest) or (variant != 'original' and variant not in DERIVATIVES):
+        return None
+    if not os.path.exists(object_path(digest)):
+        return None
+    if variant == 'original':
+        conn = get_db_connection()
+        row = conn.execute('SELECT mime FROM images WHERE digest=?', (digest,)).fetchone()
+        conn.close()
+        # Rows from before content sniffing may hold whatever the client claimed
+        mime = row['mime'] if row and (row['mime'] or '').startswith('image/') else 'application/octet-stream'
+        return object_path(digest), mime
+    return generate_derivative(digest, variant), DERIVATIVE_MIME
+
+def remove_object(digest):
+    for variant in ['original'] + list(DERIVATIVES):
+        path = object_path(digest, variant)
+        if os.path.exists(path):
+            os.remove(path)
+
+def gc_orphans(grace=ORPHAN_GRACE, dry_run=False):
+    """
+    1. Drops references older than `grace` that no expense points at (shard by shard).
+    2. Deletes images nobody references any more (rows and files).
+    3. Deletes files on disk with no images row (interrupted uploads).
+
+    An upload racing with the GC re-stamps images.created_at, in the same transaction as
+    its reference, before it puts the file in place. Step 1 re-checks the reference's age
+    in the DELETE itself, and step 2 re-checks the image's stamp under the directory write
+    lock and removes the files before releasing it. So a reference refreshed during the
+    scan is kept, an image re-uploaded during it is never deleted, and a file removed by
+    the GC is put back by the upload that follows.
+    """
+    cutoff = (datetime.utcnow() - grace).isoformat(timespec='seconds')
+
+    # Correlated on the outer table so it works as a bare DELETE too
+    stale_refs = '''FROM main.image_refs WHERE created_at < ? AND NOT EXISTS
+                    (SELECT 1 FROM main.expenses e
+                     WHERE e.user_id = image_refs.user_id AND e.image_key = image_refs.digest)'''
+    stale_count = 0
+    live = set()
+    for _, shard in iter_shards():
+        stale = set()
+        if dry_run:
+            stale = {(r['user_id'], r['digest'])
+                     for r in shard.execute('SELECT user_id, digest ' + stale_refs, (cutoff,)).fetchall()}
+            stale_count += len(stale)
+        else:
+            # Checked and deleted in one statement: a ref re-uploaded or saved on an expense
+            # meanwhile no longer matches
+            stale_count += shard.execute('DELETE ' + stale_refs, (cutoff,)).rowcount
+            shard.commit()
+        live |= {r['digest'] for r in shard.execute('SELECT user_id, digest FROM main.image_refs').fetchall()
+                 if (r['user_id'], r['digest']) not in stale}
+
+    conn = get_db_connection()
+    images = conn.execute('SELECT digest, created_at FROM images').fetchall()
+    known = {r['digest'] for r in images}
+    orphans = [r['digest'] for r in images if r['digest'] not in live and (r['created_at'] or '') < cutoff]
+    if not dry_run:
+        removed = []
+        for digest in orphans:
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('DELETE FROM images WHERE digest=? AND COALESCE(created_at, \'\') < ?',
+                            (digest, cutoff)).rowcount:
+                remove_object(digest)
+                removed.append(digest)
+            conn.commit()
+        orphans = removed
+    conn.close()
+
+    removed_files = 0
+
+    # Stray files: leftovers of interrupted uploads/derivatives or rows deleted by hand
+    cutoff_ts = (datetime.utcnow() - grace).timestamp()
+    if os.path.isdir(MEDIA_FOLDER):
+        for root, _, files in os.walk(MEDIA_FOLDER):
+            for name in files:
+                if name.split('.', 1)[0] in known and not name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                if os.path.getmtime(path) < cutoff_ts:
+                    if not dry_run:
+                        os.remove(path)
+                    removed_files += 1
+
+    return {"stale_refs": stale_count, "orphan_images": len(orphans), "stray_files": removed_files}
+
+if __name__ == "__main__":
+    # python storage.py gc [--dry-run]
+    if len(sys.argv) < 2 or sys.argv[1] != 'gc':
+        sys.exit("Usage: python storage.py gc [--dry-run]")
+    dry = '--dry-run' in sys.argv
+    result = gc_orphans(dry_run=dry)
+    prefix = "🔍 Would remove" if dry else "🧹 Removed"
+    print(f"{prefix} {result['stale_refs']} stale references, {result['orphan_images']} orphan images, "
+          f"{result['stray_files']} stray files.")
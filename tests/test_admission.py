@@ -0,0 +1,41 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionPool, split_thread_budget, check_thread_budget
+
+@pytest.mark.parametrize('threads', [6, 8, 12, 16, 32])
+def test_every_pool_can_queue(threads):
+    reserved = max(2, threads * 3 // 8)
+    split = split_thread_budget(threads, reserved, (1, 2))
+    assert all(run >= 1 and wait >= 1 for run, wait in split)
+    assert sum(run + wait for run, wait in split) == threads - reserved
+
+def test_small_budget_still_runs_one_each():
+    assert split_thread_budget(4, 2, (1, 2)) == [(1, 0), (1, 0)]
+    with pytest.raises(RuntimeError):
+        split_thread_budget(3, 2, (1, 2))
+
+def test_check_rejects_pools_that_eat_crud_threads():
+    pools = [AdmissionPool('upload', 2, 2), AdmissionPool('chat', 2, 2)]
+    check_thread_budget(pools, 12, 4)
+    with pytest.raises(RuntimeError):
+        check_thread_budget(pools, 8, 3)
+
+def test_second_request_waits_for_the_slot():
+    pool = AdmissionPool('upload', *split_thread_budget(8, 3, (1, 2))[0], queue_timeout=5)
+    assert pool.acquire() == (True, 0)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(pool.acquire()[0]))
+    waiter.start()
+    while pool.queued == 0:
+        pass
+    # Queue full now: a third request is turned away
+    assert pool.acquire()[0] is False
+    pool.release(0.1)
+    waiter.join(5)
+    assert result == [True]
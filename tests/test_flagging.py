@@ -0,0 +1,47 @@
+import os
+import sys
+import random
+import sqlite3
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import flagging
+
+def make_ledger(rows=600, spikes=(), seed=5):
+    """ Heavy-tailed (lognormal) food spend for two users; `spikes` are row numbers x25. """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    database.create_user_tables(conn.cursor())
+    start = date(2026, 1, 1)
+    for i in range(rows):
+        amount = round(rng.lognormvariate(6, 0.6) * (25 if i in spikes else 1), 2)
+        conn.execute('''INSERT INTO expenses (user_id, date, merchant, amount, currency, base_amount, category, type)
+                        VALUES (?, ?, ?, ?, 'INR', ?, 'Food', 'Debit')''',
+                     (1 + i % 2, (start + timedelta(days=i // 2)).isoformat(), f"Shop {i}", amount, amount))
+    conn.commit()
+    return conn
+
+def spike_ids(conn):
+    return {r['id'] for r in conn.execute('SELECT id, flag_reason FROM expenses')
+            if (r['flag_reason'] or '').startswith(flagging.SPIKE_PREFIX)}
+
+def test_normal_heavy_tailed_spend_is_not_flagged():
+    conn = make_ledger()
+    flagging.flag_users(conn)
+    assert spike_ids(conn) == set()
+
+def test_injected_spikes_are_flagged():
+    conn = make_ledger(spikes={100, 301, 450})
+    flagging.flag_users(conn)
+    assert spike_ids(conn) == {101, 302, 451}
+
+def test_incremental_matches_batch():
+    conn = make_ledger(spikes={100, 301, 450}, seed=9)
+    flagging.flag_users(conn)
+    batch = spike_ids(conn)
+    incremental = {r['id'] for r in conn.execute('SELECT id, user_id FROM expenses').fetchall()
+                   if (flagging.score_expense(conn, r['user_id'], r['id']) or '').startswith(flagging.SPIKE_PREFIX)}
+    assert incremental == batch
@@ -0,0 +1,95 @@
+import os
+import sys
+import sqlite3
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from forecast import forecast_budgets, is_budget_question
+
+TODAY = date(2026, 10, 15)
+
+def make_conn():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    database.create_user_tables(conn.cursor())
+    return conn
+
+def add_budget(conn, user_id, start, end, amount=1000, category='Food'):
+    conn.execute('INSERT INTO budgets (user_id, category, amount, start_date, end_date) VALUES (?, ?, ?, ?, ?)',
+                 (user_id, category, amount, start, end))
+
+def add_expense(conn, user_id, day, amount, category='Food'):
+    conn.execute('''INSERT INTO expenses (user_id, date, amount, base_amount, category, type)
+                    VALUES (?, ?, ?, ?, ?, 'Debit')''', (user_id, day, amount, amount, category))
+
+def test_forecast_projects_active_budget():
+    conn = make_conn()
+    add_budget(conn, 1, '2026-10-01', '2026-10-30')
+    add_expense(conn, 1, '2026-10-05', 300)
+    add_expense(conn, 1, '2026-10-14', 300)
+    add_expense(conn, 1, '2025-02-30', 999)  # not a real day, skipped
+
+    [b] = forecast_budgets(conn, 1, today=TODAY)
+    assert b['spent'] == 600
+    assert b['active']
+    assert b['daily_burn_rate'] > 0
+    assert b['projected_spend'] > b['limit']
+    assert b['overrun_date'] is not None
+
+def test_bad_dates_keep_the_budget_without_forecast():
+    conn = make_conn()
+    add_budget(conn, 1, '2026-10-01', '2026-10-30')
+    add_budget(conn, 1, None, None, category='Travel')
+    add_budget(conn, 1, 'soon', '2026-13-45', category='Shopping')
+    add_budget(conn, 1, '2026-10-30', '2026-10-01', category='Medical')
+    add_budget(conn, 1, '0001-01-01', '9999-12-31', category='Other')
+    add_expense(conn, 1, '2026-10-05', 100)
+
+    budgets = forecast_budgets(conn, 1, today=TODAY)
+    assert len(budgets) == 5
+    by_category = {b['category']: b for b in budgets}
+    assert by_category['Food']['active']
+    for category in ('Travel', 'Shopping', 'Medical', 'Other'):
+        b = by_category[category]
+        assert not b['active'] and b['projected_spend'] is None
+
+def test_all_users_forecast_matches_per_user():
+    conn = make_conn()
+    add_budget(conn, 1, '2026-10-01', '2026-10-30')
+    add_budget(conn, 2, '2016-01-01', '2016-01-31')
+    add_expense(conn, 1, '2026-10-05', 100)
+    add_expense(conn, 2, '2016-01-10', 50)
+
+    everyone = {b['id']: b for b in forecast_budgets(conn, today=TODAY)}
+    for user_id in (1, 2):
+        for b in forecast_budgets(conn, user_id, today=TODAY):
+            assert everyone[b['id']] == b
+
+@pytest.mark.parametrize('message', [
+    "Will I blow my budget?",
+    "am I on track with my budgets this month?",
+    "Will I overspend on food?",
+    "Am I going to exceed the travel budget?",
+    "Is my Food budget going to run out?",
+    "will we stay within our budget",
+])
+def test_budget_questions_answered_locally(message):
+    assert is_budget_question(message, ['Food', 'Travel'])
+
+@pytest.mark.parametrize('message', [
+    "any tips to avoid overspending?",
+    "What's the forecast for my savings?",
+    "How do I exceed my savings goal?",
+    "Will I run out of money before payday?",
+    "Is it bad to exceed my budget sometimes?",
+    "I blew my budget on food, any tips?",
+    "Will I overspend on food?",  # no Food budget
+    "",
+    None,
+])
+def test_other_questions_go_to_the_llm(message):
+    assert not is_budget_question(message, ['Travel'])
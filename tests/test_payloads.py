@@ -0,0 +1,70 @@
+import os
+import sys
+import gzip
+import json
+import sqlite3
+
+import pytest
+from flask import Flask, request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import payloads
+
+app = Flask(__name__)
+
+class TrackedConnection(sqlite3.Connection):
+    closed = False
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+def make_conn(rows=5000):
+    conn = sqlite3.connect(':memory:', factory=TrackedConnection)
+    conn.execute('CREATE TABLE expenses (id INTEGER PRIMARY KEY, merchant TEXT, amount REAL)')
+    conn.executemany('INSERT INTO expenses (merchant, amount) VALUES (?, ?)',
+                     ((f"Merchant {i % 7}", i / 4) for i in range(rows)))
+    return conn
+
+def respond(conn, headers=None, query=''):
+    with app.test_request_context('/api/expenses' + query, headers=headers or {}):
+        return payloads.query_response(conn, conn.execute('SELECT * FROM expenses ORDER BY id'), request)
+
+def decode(response):
+    data = b''.join(response.response)
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'br':
+        data = payloads.brotli.decompress(data)
+    elif encoding == 'gzip':
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+def test_connection_closed_when_body_never_sent():
+    conn = make_conn()
+    response = respond(conn)
+    assert not conn.closed
+    response.close()
+    assert conn.closed
+
+@pytest.mark.parametrize('accept', ['', 'gzip', 'br'])
+def test_encodings_round_trip(accept):
+    if accept == 'br' and payloads.brotli is None:
+        pytest.skip('brotli not installed')
+    conn = make_conn()
+    expected = [dict(zip(('id', 'merchant', 'amount'), row)) for row in conn.execute('SELECT * FROM expenses ORDER BY id')]
+    response = respond(conn, {'Accept-Encoding': accept} if accept else None)
+    assert response.headers.get('Content-Encoding') == (accept or None)
+    assert decode(response) == expected
+    response.close()
+    assert conn.closed
+
+def test_columnar_decodes_to_rows():
+    conn = make_conn()
+    expected = [list(row) for row in conn.execute('SELECT * FROM expenses ORDER BY id')]
+    payload = decode(respond(conn, {'Accept-Encoding': 'gzip'}, '?format=columnar'))
+    names, dicts = payload['columns'], payload['dictionaries']
+    assert payload['count'] == len(expected)
+    decoded = [[dicts[c][v] if c in dicts else v for c, v in zip(names, values)]
+               for block in payload['blocks'] for values in zip(*block)]
+    assert decoded == expected
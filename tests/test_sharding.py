@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import sharding
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, 'SHARD_COUNT', 3)
+    database.init_db()
+    conn = database.get_db_connection()
+    for user_id in (1, 2, 3):
+        conn.execute("INSERT INTO users (id, username, password_hash) VALUES (?, ?, 'x')", (user_id, f'u{user_id}'))
+        database.assign_shard(conn, user_id)
+    conn.commit()
+    conn.close()
+
+def add_expense(user_id, flag_reason=None):
+    conn = database.get_db_connection(user_id)
+    cur = conn.execute("INSERT INTO expenses (user_id, amount, flag_reason) VALUES (?, 1, ?)", (user_id, flag_reason))
+    conn.execute("INSERT INTO budgets (user_id, amount) VALUES (?, 1)", (user_id,))
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
+
+def rows(table):
+    return database.query_all_shards(f'SELECT * FROM main.{table}')
+
+def assert_ids_unique_and_in_range():
+    for table in database.ID_TABLES:
+        found = rows(table)
+        ids = [r['id'] for r in found]
+        assert len(ids) == len(set(ids)), table
+        for r in found:
+            lo, hi = database.id_range(r['_shard'])
+            assert lo <= r['id'] < hi, (table, r)
+
+@pytest.mark.parametrize('target', ['shard_00', 'main'])
+def test_moves_keep_ids_unique(shards, target):
+    # user 2 starts on shard_02 (the highest range): move it down, insert on both sides,
+    # move it back up and insert again
+    assert database.shard_for_user(2) == 'shard_02'
+    first = add_expense(2)
+    add_expense(2, flag_reason=f"Possible duplicate of ID {first}")
+    add_expense(3)
+
+    sharding.move_user(2, target)
+    for user_id in (1, 2, 3):
+        add_expense(user_id)
+    assert_ids_unique_and_in_range()
+
+    sharding.move_user(2, 'shard_02')
+    for user_id in (1, 2, 3):
+        add_expense(user_id)
+    assert_ids_unique_and_in_range()
+
+    # The flag still points at the (renumbered) original
+    ids = {r['id'] for r in rows('expenses') if r['user_id'] == 2}
+    reasons = [r['flag_reason'] for r in rows('expenses') if r['user_id'] == 2 and r['flag_reason']]
+    assert len(reasons) == 1 and int(reasons[0].rsplit(' ', 1)[1]) in ids
+    assert len(ids) == 4
+
+def test_failed_move_leaves_user_in_place(shards, monkeypatch):
+    add_expense(2)
+    monkeypatch.setattr(sharding, 'USER_TABLES', ('expenses', 'budgets', 'no_such_table'))
+    with pytest.raises(Exception):
+        sharding.move_user(2, 'shard_00')
+    assert database.shard_for_user(2) == 'shard_02'
+    assert [r['_shard'] for r in rows('expenses')] == ['shard_02']
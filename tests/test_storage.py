@@ -0,0 +1,113 @@
+import io
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import storage
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage, 'generate_derivatives', lambda digest: None)
+    database.init_db()
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'u1', 'x')")
+    conn.commit()
+    conn.close()
+
+def upload(data, mimetype):
+    return storage.store_upload(FileStorage(io.BytesIO(data), filename='bill', content_type=mimetype), 1)
+
+def png_bytes(color='red'):
+    buf = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buf, 'PNG')
+    return buf.getvalue()
+
+def age(digest, hours):
+    stamp = (datetime.utcnow() - timedelta(hours=hours)).isoformat(timespec='seconds')
+    conn = database.get_db_connection()
+    conn.execute('UPDATE images SET created_at=? WHERE digest=?', (stamp, digest))
+    conn.execute('UPDATE image_refs SET created_at=? WHERE digest=?', (stamp, digest))
+    conn.commit()
+    conn.close()
+
+def test_mime_comes_from_content(media):
+    digest = upload(png_bytes(), 'text/html')
+    assert storage.resolve(digest) == (storage.object_path(digest), 'image/png')
+
+def test_non_image_rejected(media):
+    with pytest.raises(storage.UnsupportedImage):
+        upload(b'<script>alert(1)</script>', 'image/png')
+    assert database.get_db_connection().execute('SELECT COUNT(*) FROM images').fetchone()[0] == 0
+    assert [f for _, _, files in os.walk(storage.MEDIA_FOLDER) for f in files] == []
+
+def test_gc_keeps_images_reuploaded_during_scan(media, monkeypatch):
+    old = upload(png_bytes('red'), 'image/png')
+    again = upload(png_bytes('blue'), 'image/png')
+    age(old, 48)
+    age(again, 48)
+
+    def scan_then_upload():
+        yield from database.iter_shards()
+        # Both refs were stale when scanned; this image is uploaded again before the delete
+        upload(png_bytes('blue'), 'image/png')
+    monkeypatch.setattr(storage, 'iter_shards', scan_then_upload)
+
+    result = storage.gc_orphans()
+    assert result['orphan_images'] == 1
+    assert storage.resolve(old) is None
+    assert storage.resolve(again) is not None
+
+class UploadBeforeDelete:
+    """ Shard connection that lets an upload land just before the GC's DELETE runs. """
+    def __init__(self, conn, digest_color):
+        self.conn = conn
+        self.color = digest_color
+
+    def _maybe_upload(self, sql):
+        if self.color and sql.lstrip().upper().startswith('DELETE'):
+            upload(png_bytes(self.color), 'image/png')
+            self.color = None
+
+    def execute(self, sql, *args):
+        self._maybe_upload(sql)
+        return self.conn.execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        self._maybe_upload(sql)
+        return self.conn.executemany(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+def test_gc_keeps_refs_refreshed_before_delete(media, monkeypatch):
+    digest = upload(png_bytes('green'), 'image/png')
+    age(digest, 48)
+
+    def shards():
+        for name, conn in database.iter_shards():
+            yield name, UploadBeforeDelete(conn, 'green')
+    monkeypatch.setattr(storage, 'iter_shards', shards)
+
+    result = storage.gc_orphans()
+    assert result == {"stale_refs": 0, "orphan_images": 0, "stray_files": 0}
+    assert storage.user_has_image(1, digest)
+    assert storage.resolve(digest) is not None
+
+def test_media_served_outside_the_app_directory(media):
+    # The fixture runs from tmp_path, not the app's root_path
+    import app as flask_app
+    digest = upload(png_bytes(), 'image/png')
+    client = flask_app.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    response = client.get(f'/media/{digest}')
+    assert response.status_code == 200
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'